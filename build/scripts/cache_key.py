@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+# Keys for the build cache of a package, from what goes into the build: the
+# package directory, the directories of its local dependencies, the spack commit,
+# and the compiler and architecture. The primary key is exact, and the restore
+# keys fall back to the same inputs with another spack commit, then to the same
+# package. A manifest in the install tree records what each cached install was
+# built from, so after restoring a fallback we know which installs are still valid.
+# python build/scripts/cache_key.py keys flux-core --spack-root /opt/spack --arch x86_64_v3
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+# Shared helpers are in the root scripts directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(here)), "scripts"))
+from package_graph import PackageGraph
+
+# Increment to invalidate every cache entry
+key_version = 1
+
+manifest_name = ".spack-updater-manifest.json"
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description="Spack Updater Build Cache Keys",
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    keys = subparsers.add_parser("keys", help="show the cache key and restore keys")
+    check = subparsers.add_parser(
+        "check", help="show which cached installs are still valid"
+    )
+    record = subparsers.add_parser(
+        "record", help="record a package (and its dependencies) in the manifest"
+    )
+    for command in [keys, check, record]:
+        command.add_argument("package", help="package to build")
+        command.add_argument(
+            "--repo",
+            help="repository with packages directory (defaults to PWD)",
+            default=os.getcwd(),
+        )
+        command.add_argument(
+            "--spack-root",
+            help="spack checkout (defaults to /opt/spack)",
+            default="/opt/spack",
+        )
+        command.add_argument(
+            "--install-root",
+            help="cached install tree with the manifest (defaults to <spack-root>/opt/spack)",
+        )
+        command.add_argument(
+            "--compiler",
+            help="compiler spec (defaults to the first line of cc --version)",
+        )
+        command.add_argument(
+            "--arch", help="microarchitecture (e.g., from archspec cpu)", default=""
+        )
+        command.add_argument(
+            "--os",
+            help="operating system image (defaults to ImageOS or the platform)",
+            default=os.environ.get("ImageOS") or sys.platform,
+        )
+    return parser
+
+
+def run(cmd, cwd=None):
+    """
+    Run a command and return the first line of output, or None if it fails.
+    """
+    try:
+        out = subprocess.run(
+            cmd, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+    except OSError:
+        return
+    if out.returncode != 0:
+        return
+    lines = out.stdout.decode("utf-8").strip().split("\n")
+    return lines[0].strip() or None
+
+
+def slug(value):
+    """
+    Make a value safe (and short) for a cache key.
+    """
+    value = "".join(x if x.isalnum() or x in "._@" else "-" for x in value)
+    return value.strip("-")[:40] or "none"
+
+
+class CacheKeys:
+    """
+    Derive build cache keys and manage the manifest of cached installs.
+    """
+
+    def __init__(self, graph, package, spack_root, compiler, arch, os_name):
+        if package not in graph.packages:
+            raise ValueError(f"{package} is not a package in {graph.root}")
+        self.graph = graph
+        self.package = package
+        self.spack_commit = run(["git", "rev-parse", "HEAD"], cwd=spack_root)
+        self.compiler = compiler or run(["cc", "--version"]) or "unknown"
+        self.arch = arch or "unknown"
+        self.os = os_name
+
+    @property
+    def platform(self):
+        return "%s-%s-%s" % (slug(self.os), slug(self.arch), slug(self.compiler))
+
+    @property
+    def prefix(self):
+        # Package names have single dashes, so flux-- is not a prefix of flux-core--
+        return "spack-build-v%s-%s-%s--" % (key_version, self.platform, self.package)
+
+    def inputs(self, package):
+        """
+        What a package is built from, for the manifest.
+        """
+        return {
+            "input_hash": self.graph.input_hash(package),
+            "spack_commit": self.spack_commit,
+            "compiler": self.compiler,
+            "arch": self.arch,
+            "os": self.os,
+        }
+
+    def keys(self):
+        """
+        Get the primary key and restore keys, most specific first.
+
+        The input hash of a package covers its local dependencies, so the
+        fallbacks are: the same inputs with another spack commit, and then
+        any build of the package on this platform.
+        """
+        input_hash = self.graph.input_hash(self.package)[:16]
+        with_inputs = self.prefix + input_hash + "-"
+        primary = with_inputs + (self.spack_commit or "unknown")[:12]
+        return {"key": primary, "restore_keys": [with_inputs, self.prefix]}
+
+    def check(self, manifest):
+        """
+        Sort packages in a manifest by whether their installs are still valid.
+
+        An install is valid if it was built from the same inputs, and stale
+        for a package (here) if anything it was built from changed.
+        """
+        result = {"valid": [], "stale": [], "missing": []}
+        for package in [self.package] + self.graph.transitive_dependencies(
+            [self.package]
+        ):
+            entry = manifest.get(package)
+            if not entry:
+                result["missing"].append(package)
+                continue
+            inputs = {k: v for k, v in entry.items() if k in self.inputs(package)}
+            if inputs == self.inputs(package):
+                result["valid"].append(package)
+            else:
+                result["stale"].append(package)
+        return result
+
+    def record(self, manifest):
+        """
+        Record a built package, and its local dependencies, in a manifest.
+        """
+        now = time.time()
+        for package in [self.package] + self.graph.transitive_dependencies(
+            [self.package]
+        ):
+            entry = self.inputs(package)
+            entry["recorded"] = now
+            manifest[package] = entry
+        return manifest
+
+
+def read_manifest(filename):
+    try:
+        with open(filename, "r") as fd:
+            return json.loads(fd.read())
+    except (OSError, ValueError):
+        return {}
+
+
+def set_output(name, value):
+    output_file = os.environ.get("GITHUB_OUTPUT")
+    if not output_file:
+        return
+
+    # Multiple lines use a delimiter
+    with open(output_file, "a") as fd:
+        if "\n" in value:
+            fd.write(f"{name}<<EOF\n{value}\nEOF\n")
+        else:
+            fd.write(f"{name}={value}\n")
+
+
+def main():
+
+    parser = get_parser()
+
+    # If an error occurs while parsing the arguments, the interpreter will exit with value 2
+    args, extra = parser.parse_known_args()
+    try:
+        keys = CacheKeys(
+            PackageGraph(args.repo),
+            args.package,
+            args.spack_root,
+            args.compiler,
+            args.arch,
+            args.os,
+        )
+    except ValueError as e:
+        sys.exit(str(e))
+
+    install_root = args.install_root or os.path.join(args.spack_root, "opt", "spack")
+    manifest_file = os.path.join(install_root, manifest_name)
+
+    if args.command == "keys":
+        result = keys.keys()
+        print(json.dumps(result, indent=4))
+        set_output("key", result["key"])
+        set_output("restore-keys", "\n".join(result["restore_keys"]))
+
+    elif args.command == "check":
+        result = keys.check(read_manifest(manifest_file))
+        print(json.dumps(result, indent=4))
+        set_output("valid", json.dumps(result["valid"]))
+        set_output("stale", json.dumps(result["stale"]))
+
+    else:
+        os.makedirs(install_root, exist_ok=True)
+        manifest = keys.record(read_manifest(manifest_file))
+        with open(manifest_file, "w") as fd:
+            fd.write(json.dumps(manifest, indent=4))
+        print(f"Recorded {args.package} in {manifest_file}")
+
+
+if __name__ == "__main__":
+    main()
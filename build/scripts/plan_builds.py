@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import sys
+
+# Plan builds of local packages in dependency order: packages are sorted into
+# layers (each only depends on earlier layers), and packages whose inputs (the
+# package and its local dependencies) were already built are skipped.
+# python build/scripts/plan_builds.py plan --repo .
+# python build/scripts/plan_builds.py plan --records actions
+# python build/scripts/plan_builds.py record flux-core --repo .
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+# Shared helpers are in the root scripts directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(here)), "scripts"))
+import cache
+import client
+import state
+from cache_key import key_version
+from package_graph import PackageGraph
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description="Spack Updater Build Planner",
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    parser.add_argument(
+        "--repo",
+        help="repository with packages directory (defaults to PWD)",
+        default=os.getcwd(),
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    plan = subparsers.add_parser("plan", help="plan layers of packages to build")
+    plan.add_argument(
+        "packages",
+        nargs="*",
+        help="packages to consider (defaults to all)",
+    )
+    plan.add_argument(
+        "--rebuild",
+        action="store_true",
+        default=False,
+        help="build every package, even if its inputs were built before",
+    )
+    plan.add_argument(
+        "--records",
+        choices=["state", "actions"],
+        default="state",
+        help="where successful builds are recorded: the local state store, or the\nbuild caches of the repository in GitHub Actions (defaults to state)",
+    )
+    plan.add_argument("--output", help="write the plan to this json file")
+    record = subparsers.add_parser("record", help="record a package build")
+    record.add_argument("package", help="package that was built")
+    record.add_argument(
+        "--status",
+        default="success",
+        help="outcome of the build (defaults to success)",
+    )
+    return parser
+
+
+class ActionsCacheRecords:
+    """
+    Successful builds, from the build caches saved in GitHub Actions.
+
+    Each build job saves its install tree (when it succeeds) under a key with
+    the input hash of the package (see cache_key.py), and the caches of a
+    repository can be listed, so a planner job sees the builds of every job.
+    """
+
+    def __init__(self, repo, headers):
+        self.repo = repo
+        self.headers = headers
+        self._keys = None
+
+    @property
+    def keys(self):
+        if self._keys is None:
+            url = f"{client.api_url}/repos/{self.repo}/actions/caches"
+            params = {"key": "spack-build-v%s-" % key_version, "per_page": 100}
+            self._keys = []
+            while url:
+                response = cache.get(url, headers=self.headers, params=params)
+                if response.status_code != 200:
+                    sys.exit("Issue listing build caches: %s" % response.status_code)
+                self._keys += [x["key"] for x in response.json()["actions_caches"]]
+                url = response.links.get("next", {}).get("url")
+                params = None
+        return self._keys
+
+    def was_built(self, package, input_hash):
+        """
+        Determine if a build cache was saved for a package with these inputs.
+        """
+        part = "-%s--%s-" % (package, input_hash[:16])
+        return any(part in key for key in self.keys)
+
+
+def plan_builds(graph, packages=None, store=None):
+    """
+    Plan the layers of packages to build.
+
+    A package is built if it (or anything it depends on here) changed since
+    a successful build. Skipped packages are reused by the packages that
+    depend on them, so layers only order the packages that are built.
+    """
+    packages = packages or graph.packages
+    hashes = {name: graph.input_hash(name) for name in packages}
+    build = []
+    skipped = []
+    for name in packages:
+        if store and store.was_built(name, hashes[name]):
+            skipped.append(name)
+        else:
+            build.append(name)
+
+    layers = graph.layers(build)
+    return {
+        "layers": layers,
+        "matrix": [
+            {"package": name, "layer": i}
+            for i, layer in enumerate(layers)
+            for name in layer
+        ],
+        "skipped": skipped,
+        "hashes": hashes,
+        "dependencies": {name: graph.dependencies[name] for name in packages},
+    }
+
+
+def set_output(name, value):
+    output_file = os.environ.get("GITHUB_OUTPUT")
+    if output_file:
+        with open(output_file, "a") as fd:
+            fd.write(f"{name}={value}\n")
+
+
+def main():
+
+    parser = get_parser()
+
+    # If an error occurs while parsing the arguments, the interpreter will exit with value 2
+    args, extra = parser.parse_known_args()
+    graph = PackageGraph(args.repo)
+    store = state.StateStore()
+
+    if args.command == "plan" and args.records == "actions":
+        repo = os.environ.get("GITHUB_REPOSITORY")
+        token = os.environ.get("GITHUB_TOKEN")
+        if not repo or not token:
+            sys.exit(
+                "GITHUB_REPOSITORY and GITHUB_TOKEN are required for actions records."
+            )
+        headers = {
+            "Accept": "application/vnd.github+json",
+            "Authorization": "token %s" % token,
+        }
+        store = ActionsCacheRecords(repo, headers)
+
+    if args.command == "record":
+        if args.package not in graph.packages:
+            sys.exit(f"{args.package} is not a package in {graph.root}")
+        store.record_build(args.package, graph.input_hash(args.package), args.status)
+        print(f"Recorded {args.status} build of {args.package}")
+        return
+
+    unknown = [x for x in args.packages if x not in graph.packages]
+    if unknown:
+        sys.exit(f"Packages not found in {graph.root}: {' '.join(unknown)}")
+
+    plan = plan_builds(graph, args.packages, None if args.rebuild else store)
+    for i, layer in enumerate(plan["layers"]):
+        print("layer %s: %s" % (i, " ".join(layer)))
+    if plan["skipped"]:
+        print("skipped: %s" % " ".join(plan["skipped"]))
+
+    if args.output:
+        with open(args.output, "w") as fd:
+            fd.write(json.dumps(plan, indent=4))
+
+    # Each layer can be a matrix for a job that needs the previous layer
+    set_output("plan", json.dumps(plan))
+    set_output("layers", len(plan["layers"]))
+    for i, layer in enumerate(plan["layers"]):
+        set_output(f"layer{i}", json.dumps(layer))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,161 @@
 #!/usr/bin/env python3
 
 import argparse
+import json
 import os
+import re
 import sys
 
+import yaml
+
+# Parse one issue text file into environment variables for the update:
+# python parse-issue/scripts/parse_issue.py new-issue.txt
+# Or every open [package-update] issue of a repository into one work list:
+# python parse-issue/scripts/parse_issue.py --batch --repo flux-framework/spack
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+# Shared helpers are in the root scripts directory (only needed for --batch)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(here)), "scripts"))
+
 # If we are in an issue, get title from environment
 title = os.environ.get("title")
 
+title_tag = "[package-update]"
+
 
 def get_parser():
     parser = argparse.ArgumentParser(
         description="Spack Updater Issue Parser",
         formatter_class=argparse.RawTextHelpFormatter,
     )
-    parser.add_argument("issue_text", help="path to issue text file.")
+    parser.add_argument("issue_text", nargs="?", help="path to issue text file.")
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        default=False,
+        help="parse every open [package-update] issue into a work list",
+    )
+    parser.add_argument(
+        "--repo",
+        help="repository with the issues (defaults to GITHUB_REPOSITORY)",
+        default=os.environ.get("GITHUB_REPOSITORY"),
+    )
+    parser.add_argument("--output", help="write the work list to this json file")
     return parser
 
 
 env_file = os.getenv("GITHUB_ENV")
 
 
+def parse_issue_text(text):
+    """
+    Parse the metadata of an issue body into a dict.
+
+    The body starts with a sentence for humans and ends with YAML (from
+    yaml.dump of the request), so we parse YAML from the first line that
+    looks like a key. Bodies that aren't YAML fall back to key: value lines.
+    Values are kept as written (e.g., branch 1.10 is not the number 1.1).
+    """
+    lines = text.replace("\r\n", "\n").split("\n")
+    for i, line in enumerate(lines):
+        if not re.match("^[A-Za-z_][A-Za-z0-9_-]*:", line):
+            continue
+        try:
+            data = yaml.load("\n".join(lines[i:]), Loader=yaml.BaseLoader)
+        except yaml.YAMLError:
+            break
+        if isinstance(data, dict):
+            return {str(k): "" if v is None else str(v) for k, v in data.items()}
+        break
+    return {
+        xx.split(":", 1)[0].strip(): xx.split(":", 1)[-1].strip()
+        for xx in [x for x in lines if ":" in x]
+    }
+
+
+def normalize_repo(repo):
+    if repo and not repo.startswith("http"):
+        repo = "https://github.com/%s" % repo
+    return repo
+
+
+def work_list(issues):
+    """
+    Parse [package-update] issues into one work item per package.
+
+    The newest issue for a package is kept, and older ones are listed as
+    duplicates. Issues without package metadata are skipped.
+    """
+    work = {}
+    skipped = []
+    for issue in sorted(issues, key=lambda x: x["number"], reverse=True):
+        if title_tag not in issue["title"]:
+            continue
+        values = parse_issue_text(issue.get("body") or "")
+        package = values.get("package") or os.path.basename(
+            values.get("path", "").rstrip("/")
+        )
+        if not package or not values.get("action"):
+            skipped.append(issue["number"])
+            continue
+        if package in work:
+            work[package]["duplicates"].append(issue["number"])
+            continue
+        item = dict(values)
+        item.update(
+            {
+                "package": package,
+                "repo": normalize_repo(values.get("repo")),
+                "issue": issue["number"],
+                "duplicates": [],
+            }
+        )
+        work[package] = item
+    return {"work": [work[x] for x in sorted(work)], "skipped": skipped}
+
+
+def set_output(name, value):
+    output_file = os.environ.get("GITHUB_OUTPUT")
+    if output_file:
+        with open(output_file, "a") as fd:
+            fd.write(f"{name}={value}\n")
+
+
+def main_batch(args):
+    from issues import list_issues
+
+    if not args.repo:
+        sys.exit("A --repo (or GITHUB_REPOSITORY) is required for --batch.")
+    headers = {"Accept": "application/vnd.github+json"}
+    token = os.environ.get("GITHUB_TOKEN")
+    if token:
+        headers["Authorization"] = "token %s" % token
+
+    result = work_list(list_issues(args.repo, headers))
+    for item in result["work"]:
+        duplicates = " ".join("#%s" % x for x in item["duplicates"])
+        print(
+            "%-30s #%-6s %s %s"
+            % (item["package"], item["issue"], item["action"], duplicates)
+        )
+    if args.output:
+        with open(args.output, "w") as fd:
+            fd.write(json.dumps(result, indent=4))
+    set_output("work", json.dumps(result["work"]))
+    set_output("count", len(result["work"]))
+
+
 def main():
 
     parser = get_parser()
 
     # If an error occurs while parsing the arguments, the interpreter will exit with value 2
     args, extra = parser.parse_known_args()
+    if args.batch:
+        return main_batch(args)
+    if not args.issue_text:
+        sys.exit("Please provide an issue text file, or --batch.")
 
     # Show args to the user
     print("issue-txt: %s" % args.issue_text)
@@ -35,17 +165,14 @@ def main():
         text = fd.read()
 
     # Get a dict of values
-    values = {
-        xx.split(":", 1)[0].strip(): xx.split(":", 1)[-1].strip()
-        for xx in [x for x in text.split("\n") if ":" in x]
-    }
+    values = parse_issue_text(text)
 
     # Exit early if we have a title and doesn't matach
-    if title and "[package-update]" not in title:
+    if title and title_tag not in title:
         return
     for k, v in values.items():
-        if k == "repo" and not v.startswith("http"):
-            v = "https://github.com/%s" % v
+        if k == "repo":
+            v = normalize_repo(v)
         if env_file:
             with open(env_file, "a") as fd:
                 fd.write("spack_updater_%s=%s\n" % (k.lower(), v))
@@ -1,16 +1,34 @@
 #!/usr/bin/env python3
 
 import argparse
+import concurrent.futures
 import hashlib
-import requests
-import tempfile
+import json
 import re
 import shutil
 import sys
 import os
+import time
+
+import requests
+import urllib3
 
 # Look for version updates for a package
 # python script/get_releases.py packages/flux-core
+# Or for every package in a tree (or a list of packages)
+# python script/get_releases.py --workers 8 packages/
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+# Shared helpers are in the root scripts directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(here)), "scripts"))
+import cache
+import client
+import package_index
+import releases
+import state
+from scheduler import ReleaseScheduler
+import tracing
 
 master_branch = 'version("master", branch="master"'
 main_branch = 'version("main", branch="main"'
@@ -21,12 +39,122 @@ if token:
     headers["Authorization"] = "token %s" % token
 
 
-def get_sha256sum(filename):
-    hasher = hashlib.sha256()
-    with open(filename, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            hasher.update(chunk)
-    return hasher.hexdigest()
+# Stream downloads in chunks so memory stays bounded for large tarballs
+chunk_size = 1024 * 1024
+
+# Save a resume checkpoint every this many chunks, and resume an interrupted
+# download at most this many times in one run
+checkpoint_chunks = 8
+resume_attempts = 5
+
+# Errors while streaming that a Range request can pick up from
+resumable_errors = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.ChunkedEncodingError,
+    requests.exceptions.Timeout,
+    urllib3.exceptions.ProtocolError,
+    urllib3.exceptions.ReadTimeoutError,
+)
+
+# Content types and leading bytes that indicate an error page, not an archive
+not_archive_types = ["text/html", "application/json", "text/plain"]
+not_archive_prefixes = [b"<!doctype", b"<html", b"<?xml", b"{"]
+
+
+def is_archive_type(response):
+    """
+    Determine from headers if a response could be an archive (and not an error page).
+    """
+    content_type = response.headers.get("Content-Type", "").split(";")[0].strip()
+    return content_type.lower() not in not_archive_types
+
+
+def is_archive_content(first_chunk):
+    """
+    Determine from the first bytes if content could be an archive.
+    """
+    return not first_chunk.lstrip().lower().startswith(tuple(not_archive_prefixes))
+
+
+def probe_url(url):
+    """
+    Check if a url serves an archive without downloading it.
+
+    This is a HEAD request, or a one byte range request for servers that
+    do not allow HEAD (e.g., some signed storage urls).
+    """
+    try:
+        response = client.head(url, allow_redirects=True)
+        if response.status_code in [403, 405, 501]:
+            response = client.get(url, headers={"Range": "bytes=0-0"}, stream=True)
+            response.close()
+    except Exception as e:
+        print(f"Probe of {url} failed: {e}")
+        return False
+    return response.status_code in [200, 206] and is_archive_type(response)
+
+
+class PartialDownload:
+    """
+    A download in progress in the cache, with a checkpoint of the bytes written.
+
+    The checkpoint records the offset we know is on disk and a validator (ETag
+    or Last-Modified) to resume with, so an interrupted download (in this run
+    or a previous one) can continue with a Range request.
+    """
+
+    def __init__(self, url):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        root = cache.cache_dir("downloads")
+        self.url = url
+        self.path = os.path.join(root, key + ".part")
+        self.checkpoint_file = os.path.join(root, key + ".json")
+
+    def resume(self):
+        """
+        Get the offset, hash state and validator to resume from.
+
+        The hash state is rebuilt from the partial file (truncated to the
+        checkpoint), so the final digest covers every byte.
+        """
+        hasher = hashlib.sha256()
+        checkpoint = cache.read_json(self.checkpoint_file)
+        if (
+            not checkpoint
+            or checkpoint.get("url") != self.url
+            or not os.path.exists(self.path)
+            or os.path.getsize(self.path) < checkpoint["offset"]
+        ):
+            self.discard()
+            return 0, hasher, None
+
+        offset = checkpoint["offset"]
+        with open(self.path, "r+b") as fd:
+            fd.truncate(offset)
+            for chunk in iter(lambda: fd.read(chunk_size), b""):
+                hasher.update(chunk)
+        return offset, hasher, checkpoint.get("validator")
+
+    def save(self, offset, validator):
+        cache.write_json(
+            {"url": self.url, "offset": offset, "validator": validator},
+            self.checkpoint_file,
+        )
+
+    def discard(self):
+        for path in [self.path, self.checkpoint_file]:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def get_validator(response):
+    """
+    Get a validator for If-Range (weak ETags are not allowed there).
+    """
+    etag = response.headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return response.headers.get("Last-Modified")
 
 
 def write_file(data, filename):
@@ -62,12 +190,70 @@ def set_env_and_output(name, value):
             environment_file.write("%s=%s\n" % (name, value))
 
 
+def set_output(name, value):
+    """
+    helper function to write a key/value pair to output only.
+
+    Parameters:
+    name (str)  : the name of the output
+    value (str) : the value to write to file
+    """
+    environment_file_path = os.environ.get("GITHUB_OUTPUT")
+    if not environment_file_path:
+        return
+    print("Writing %s to GITHUB_OUTPUT" % name)
+    with open(environment_file_path, "a") as environment_file:
+        environment_file.write("%s=%s\n" % (name, value))
+
+
+def find_packages(paths):
+    """
+    Given package directories and/or trees of packages, return package directories.
+
+    A path with a package.py is a package, otherwise we look one level
+    down for subdirectories that have one (e.g., packages/).
+    """
+    found = []
+    for path in paths:
+        if os.path.exists(os.path.join(path, "package.py")):
+            found.append(path)
+            continue
+        if not os.path.isdir(path):
+            sys.exit(f"{path} is not a package or directory of packages.")
+        for name in sorted(os.listdir(path)):
+            package_dir = os.path.join(path, name)
+            if os.path.exists(os.path.join(package_dir, "package.py")):
+                found.append(package_dir)
+
+    # Preserve order, but don't check the same package twice
+    seen = set()
+    unique = []
+    for package_dir in found:
+        if os.path.abspath(package_dir) in seen:
+            continue
+        seen.add(os.path.abspath(package_dir))
+        unique.append(package_dir)
+    return unique
+
+
 class PackageUpdater:
-    def __init__(self, package_dir, repo, dry_run=False):
+    def __init__(self, package_dir, repo, dry_run=False, digests="use", backfill=False):
         self.package_dir = package_dir
         self.repo = repo
         self.dry_run = dry_run
+
+        # add every release newer than the current version, not just the latest
+        self.backfill = backfill
+
+        # use cached digests, verify them with a HEAD request, or refresh them
+        self.digests = digests
         self._latest_version = None
+
+        # Releases seen by a check, for the release history
+        self.seen_releases = []
+
+        # The latest release can be looked up ahead of time (e.g., for many packages)
+        self.latest_release = None
         self._current_version = self.get_current_version()
         self.download_url = None
         self.read_package()
@@ -78,33 +264,30 @@ class PackageUpdater:
         """
         package_py = read_file(self.package_file)
         self.lines = package_py.split("\n")
-        for line in self.lines:
-            if "url=" in line.replace(" ", ""):
-                self.download_url = (
-                    line.replace(" ", "").split("url=")[-1].strip('"').strip("'")
+        self.index = package_index.get(self.package_file)
+        if self.index["url"]:
+            self.download_url = self.index["url"]
+            print(f"Setting download url to {self.download_url}")
+            if not self.repo and "github.com" not in self.download_url:
+                sys.exit(
+                    "We currently only support release updated for GitHub, please open an issue with your setup!"
+                )
+
+            # This is hacky, we can make it better :)
+            if not self.repo:
+                repo = (
+                    self.download_url.rsplit("/", 2)[0]
+                    .split("//github.com")[-1]
+                    .strip("/")
                 )
-                print(f"Setting download url to {self.download_url}")
-                if not self.repo and "github.com" not in self.download_url:
-                    sys.exit(
-                        "We currently only support release updated for GitHub, please open an issue with your setup!"
-                    )
-
-                # This is hacky, we can make it better :)
-                if not self.repo:
-                    repo = (
-                        self.download_url.rsplit("/", 2)[0]
-                        .split("//github.com")[-1]
-                        .strip("/")
-                    )
-                    self.repo = "/".join(repo.split("/")[0:2]).strip("/")
-                    print(f"Setting repo to {self.repo}")
-
-            if not self._current_version and "version(" in line and "sha256" in line:
-                current_version = line.strip().split(" ")[0]
-                for char in [" ", ",", "version(", "'", '"']:
-                    current_version = current_version.replace(char, "")
-                print(f"Found current version {current_version}")
-                self._current_version = current_version
+                self.repo = "/".join(repo.split("/")[0:2]).strip("/")
+                print(f"Setting repo to {self.repo}")
+
+        # The current version is the first with a digest
+        for entry in self.index["versions"]:
+            if not self._current_version and entry.get("sha256"):
+                print(f"Found current version {entry['version']}")
+                self._current_version = entry["version"]
 
     @property
     def package(self):
@@ -133,86 +316,222 @@ class PackageUpdater:
     def check(self):
         """
         Given a package directory and repository name, check for new releases.
+
+        Returns a result with the package, version (tag), digest and status.
         """
+        if self.backfill:
+            return self.check_backfill()
         latest = self.get_latest_release()
+        self.seen_releases.append(latest)
         version = self.current_version
         tag = latest["tag_name"]
+        result = {
+            "package": self.package,
+            "current": version,
+            "version": None,
+            "digest": None,
+            "status": "up-to-date",
+        }
 
         # Some versions are prefixed with v
         if tag == version or tag == f"v{version}":
             print("No new version found.")
-            return
+            return result
         print(f"New version {tag} detected!")
-        self.update_package(latest)
-        set_env_and_output("version", tag)
+        result["digest"] = self.update_package(latest)
+        result["version"] = tag
+        result["status"] = "dry-run" if self.dry_run else "updated"
+        return result
 
+    def check_backfill(self):
+        """
+        Add every release newer than the current version in one update.
+
+        Releases are downloaded (and hashed as they stream) concurrently.
+        The result version and digest are for the newest release.
+        """
+        # Without a current version there is nothing to backfill from
+        if not self.current_version:
+            print(f"No current version found for {self.package}, cannot backfill.")
+            return error_result(
+                self.package_dir,
+                "no version with a sha256 or VERSION file to backfill from",
+            )
+        known = [x["version"] for x in self.index["versions"]]
+        new_releases = releases.releases_since(
+            self.repo, headers, self.current_version, known
+        )
+        self.seen_releases += new_releases
+        result = {
+            "package": self.package,
+            "current": self.current_version,
+            "version": None,
+            "digest": None,
+            "versions": [],
+            "status": "up-to-date",
+        }
+        if not new_releases:
+            print("No new version found.")
+            return result
+
+        tags = [x["tag_name"] for x in new_releases]
+        print(f"New versions {' '.join(tags)} detected!")
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+            digests = list(executor.map(self.get_digest, tags))
+
+        versions = [(tag.lstrip("v"), d) for tag, d in zip(tags, digests)]
+        if not self.dry_run:
+            self.add_versions(versions)
+        result["versions"] = [
+            {"version": t, "digest": d} for t, d in zip(tags, digests)
+        ]
+        result["version"] = tags[0]
+        result["digest"] = digests[0]
+        result["status"] = "dry-run" if self.dry_run else "updated"
+        return result
+
+    @tracing.traced("get_latest_release")
     def get_latest_release(self):
         """
         Get the lateset release of a repository (under flux-framework)
         """
-        url = f"https://api.github.com/repos/{self.repo}/releases"
-        response = requests.get(url, headers=headers, params={"per_page": 100})
-        response.raise_for_status()
+        if self.latest_release:
+            return self.latest_release
 
-        # latest release should be first
-        return response.json()[0]
+        # Drafts and pre-releases are skipped, and we fall back to tags
+        return releases.latest_release(self.repo, headers)
 
+    @tracing.traced("update_package")
     def update_package(self, latest):
         """
         Write the new package version to file
         """
         tag = latest["tag_name"]
-        naked_version = tag.replace("v", "")
+        naked_version = tag.lstrip("v")
+        digest = self.get_digest(tag)
+        if not self.dry_run:
+            self.update_package_file(naked_version, digest)
+        return digest
+
+    def get_digest(self, tag):
+        """
+        Download the release for a tag to get its digest.
 
-        tmp = tempfile.mkdtemp()
-        download_path = os.path.join(tmp, "%s-%s.tar.gz" % (self.package, tag))
+        Candidate urls are probed (not downloaded) to pick one, so there is
+        one full download per version.
+        """
+        candidates = self.candidate_urls(tag)
+
+        # A digest we already have for any candidate needs no requests
+        for _, url in candidates:
+            digest = self.cached_digest(url)
+            if digest:
+                return digest
+
+        # Download the winner, and fall back to trying the rest in order
+        winner = self.resolve_url(candidates)
+        if winner:
+            candidates = [winner] + [x for x in candidates if x != winner]
+        for pattern, url in candidates:
+            digest = self.download(url)
+            if digest:
+                cache.url_patterns.set(self.package, pattern)
+                return digest
+
+        sys.exit(
+            "Failed to download new release! If there isn't support for the archive type, open an issue to request it."
+        )
+
+    def candidate_urls(self, tag):
+        """
+        Get (pattern, url) pairs a release might be downloaded from, preferred first.
+        """
+        naked_version = tag.lstrip("v")
+        candidates = []
 
         # First try: we have a download url to sub version in
         if self.download_url:
-            self.download_package_url(naked_version, download_path)
+            url = self.package_url(naked_version)
+            if url:
+                candidates.append(("package_url", url))
 
         # Fall back to deriving URL manually
-        if not os.path.exists(download_path):
-            if not self.download_release(tag, naked_version, download_path):
-                self.download_archive(naked_version, download_path)
+        candidates.append(("release", self.release_url(tag, naked_version)))
+        candidates.append(("archive", self.archive_url(naked_version)))
+        return candidates
 
-        if not os.path.exists(download_path):
-            sys.exit(
-                "Failed to download new release! If there isn't support for the archive type, open an issue to request it."
-            )
+    @tracing.traced("resolve_url")
+    def resolve_url(self, candidates):
+        """
+        Probe candidate urls concurrently and pick the preferred one that serves an archive.
 
-        # Get new digest
-        digest = get_sha256sum(download_path)
-        shutil.rmtree(tmp)
-        set_env_and_output("package", f"{self.package}@{naked_version}")
-        set_env_and_output("digest", digest)
-        if self.dry_run:
+        A candidate wins when its probe succeeds and every candidate before it
+        has failed, and probes that are no longer needed are cancelled. The
+        pattern that worked last time for the package is probed on its own first.
+        """
+        remembered = cache.url_patterns.get(self.package)
+        for candidate in candidates:
+            if candidate[0] == remembered:
+                if probe_url(candidate[1]):
+                    return candidate
+                candidates = [x for x in candidates if x != candidate]
+                break
+        if not candidates:
             return
 
-        self.update_package_file(naked_version, digest)
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(candidates))
+        futures = [executor.submit(probe_url, url) for _, url in candidates]
+        try:
+            for candidate, future in zip(candidates, futures):
+                if future.result():
+                    return candidate
+        finally:
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
 
     def update_package_file(self, version, digest):
         """
         Update the package file with a new version and digest.
         """
-        # Create new line
-        newline = '    version("%s", sha256="%s")' % (version, digest)
+        self.add_versions([(version, digest)])
+
+    def add_versions(self, versions):
+        """
+        Add new (version, digest) pairs, newest first, in one write.
+        """
+        # Add the new versions right before the current version (or the first)
+        entries = self.index["versions"]
+        entry = None
+        for candidate in entries:
+            if candidate["version"] == self._current_version:
+                entry = candidate
+                break
+        entry = entry or (entries[0] if entries else None)
+        if not entry:
+            sys.exit(f"No version() found in {self.package_file} to add to.")
+
+        # Create new lines
+        indent = " " * entry["col_offset"]
+        versions = sorted(
+            versions, key=lambda x: releases.version_key(x[0]), reverse=True
+        )
+        newlines = []
+        for version, digest in versions:
+            newline = '%sversion("%s", sha256="%s")' % (indent, version, digest)
+            print("Updating with: %s" % newline)
+            newlines.append(newline)
 
         # Write new package file
-        lines = []
-        for line in self.lines:
-            # If we find the current version line, add version before it
-            if self._current_version in line and "version(" in line:
-                print("Updating with: %s" % newline)
-                lines.append(newline)
-            lines.append(line)
+        offset = entry["lineno"] - 1
+        lines = self.lines[:offset] + newlines + self.lines[offset:]
         write_file("\n".join(lines), self.package_file)
 
         # Write version file only if exists
         if os.path.exists(self.version_file):
-            write_file(version, self.version_file)
+            write_file(versions[0][0], self.version_file)
 
-    def download_package_url(self, tag, download_path):
+    def package_url(self, tag):
         """
         Derive the new download url based on the existing one.
         """
@@ -220,36 +539,158 @@ class PackageUpdater:
         if not match:
             return
         match = match.group()
-        url = self.download_url.replace(match, tag)
-        return self.download(url, download_path)
+        return self.download_url.replace(match, tag)
+
+    def release_url(self, tag, naked_version):
+        return f"{client.server_url}/{self.repo}/releases/download/{tag}/{self.package}-{naked_version}.tar.gz"
 
-    def download_release(self, tag, naked_version, download_path):
+    def archive_url(self, naked_version):
+        return (
+            f"{client.server_url}/{self.repo}/archive/refs/tags/{naked_version}.tar.gz"
+        )
+
+    @tracing.traced("download")
+    def download(self, url, dest=None):
         """
-        Download a release tarball
+        Stream a url, hashing chunks as they arrive, and return the sha256 digest.
+
+        Content is written to a partial file in the cache, so an interrupted
+        download resumes with a Range request. If a destination is provided
+        the content is moved there, otherwise a cached digest for the url
+        can be used. None is returned on failure.
         """
-        tarball_url = f"https://github.com/{self.repo}/releases/download/{tag}/{self.package}-{naked_version}.tar.gz"
-        return self.download(tarball_url, download_path)
+        print(url)
+        tracing.current().set(url=url)
+        if not dest:
+            digest = self.cached_digest(url)
+            if digest:
+                tracing.current().set(cached=True)
+                return digest
+
+        start = time.time()
+        partial = PartialDownload(url)
+        offset, hasher, validator = partial.resume()
+        if offset:
+            print(f"Resuming {url} from {offset} bytes")
+
+        size = None
+        for _ in range(resume_attempts + 1):
+            headers = {}
+            if offset:
+                headers["Range"] = "bytes=%s-" % offset
+                if validator:
+                    headers["If-Range"] = validator
+            response = client.get(url, stream=True, headers=headers)
+
+            # The range was not satisfiable, start over
+            if offset and response.status_code == 416:
+                response.close()
+                partial.discard()
+                offset, hasher, validator = 0, hashlib.sha256(), None
+                continue
+
+            # The server ignored the range (or the file changed), start over with this response
+            if offset and response.status_code == 200:
+                print(f"Cannot resume {url}, downloading from the start.")
+                partial.discard()
+                offset, hasher = 0, hashlib.sha256()
+
+            if response.status_code not in [200, 206]:
+                response.close()
+                return
+            if not offset:
+                if not is_archive_type(response):
+                    print(f"Response from {url} is not an archive, skipping.")
+                    response.close()
+                    partial.discard()
+                    return
+                validator = get_validator(response)
+
+            try:
+                size = self.stream_to(response, partial, hasher, offset, validator)
+                break
+            except resumable_errors as e:
+                print(f"Download of {url} was interrupted: {e}")
+                offset, hasher, validator = partial.resume()
+
+        if size is None:
+            print(f"Failed to download {url}, it can be resumed in a later run.")
+            return
+        if not size:
+            print(f"Response from {url} is not an archive, skipping.")
+            partial.discard()
+            return
+
+        if dest:
+            shutil.move(partial.path, dest)
+        partial.discard()
 
-    def download(self, url, dest):
+        elapsed = max(time.time() - start, 1e-6)
+        print(
+            "Downloaded %s bytes in %.2fs (%.2f MB/s)"
+            % (size, elapsed, size / elapsed / 1024 / 1024)
+        )
+        tracing.current().set(bytes=size)
+        digest = hasher.hexdigest()
+        cache.digest_cache.set(url, size, digest, response.headers.get("ETag"))
+        return digest
+
+    def stream_to(self, response, partial, hasher, offset, validator):
         """
-        Download a url to a destination file.
+        Append a response to a partial download, returning the size on completion.
+
+        A checkpoint is saved as we go (and when interrupted), and 0 is returned
+        if the content is not an archive.
         """
-        print(url)
-        response = requests.get(url, stream=True)
-        if response.status_code == 200:
-            with open(dest, "wb") as f:
-                f.write(response.raw.read())
-            return True
-        return False
+        # Read raw bytes (not content decoded) to hash exactly what is served
+        chunks = response.raw.stream(chunk_size, decode_content=False)
+        with open(partial.path, "ab" if offset else "wb") as fd:
+            try:
+                for i, chunk in enumerate(chunks, start=1):
+                    if not offset and not is_archive_content(chunk):
+                        response.close()
+                        return 0
+                    hasher.update(chunk)
+                    fd.write(chunk)
+                    offset += len(chunk)
+                    if i % checkpoint_chunks == 0:
+                        fd.flush()
+                        partial.save(offset, validator)
+            finally:
+                fd.flush()
+                partial.save(offset, validator)
+        return offset
+
+    def cached_digest(self, url):
+        """
+        Get a digest for a url from the cache, if we have one (and it verifies).
+        """
+        if self.digests == "refresh":
+            return
+        entry = cache.digest_cache.get(url)
+        if not entry:
+            return
+        if self.digests == "verify" and not self.verify_digest(url, entry):
+            print(f"Cached digest for {url} is stale, downloading again.")
+            cache.digest_cache.remove(url)
+            return
+        print(f"Using cached digest for {url}")
+        return entry["sha256"]
 
-    def download_archive(self, naked_version, download_path):
+    def verify_digest(self, url, entry):
         """
-        Download an archive tarball.
+        Check a cached entry is still current with a HEAD request (no body).
         """
-        tarball_url = (
-            f"https://github.com/{self.repo}/archive/refs/tags/{naked_version}.tar.gz"
-        )
-        return self.download(tarball_url, download_path)
+        response = client.head(url, allow_redirects=True)
+        if response.status_code != 200:
+            return False
+        etag = response.headers.get("ETag")
+        if etag and entry.get("etag"):
+            return etag == entry["etag"]
+        size = response.headers.get("Content-Length")
+        if size:
+            return int(size) == entry["size"]
+        return False
 
 
 def get_parser():
@@ -258,11 +699,57 @@ def get_parser():
         formatter_class=argparse.RawTextHelpFormatter,
     )
     parser.add_argument(
-        "package", help="name of package under packages (in local directory) to parse"
+        "packages",
+        nargs="+",
+        help="package directories to parse, or a directory of packages (e.g., packages/)",
     )
     parser.add_argument(
         "--repo",
-        help="GitHub repository name",
+        help="GitHub repository name (single package only)",
+    )
+    parser.add_argument(
+        "--digests",
+        choices=["use", "verify", "refresh"],
+        default="use",
+        help="use cached release digests, verify them with a HEAD request, or refresh them",
+    )
+    parser.add_argument(
+        "--backfill",
+        action="store_true",
+        default=False,
+        help="add every release newer than the current version, not just the latest",
+    )
+    parser.add_argument(
+        "--skip-hours",
+        type=float,
+        default=0,
+        help="skip packages checked within this many hours (multiple packages only)",
+    )
+    parser.add_argument(
+        "--schedule",
+        action="store_true",
+        default=False,
+        help="only check packages that are due, given how often their repositories release",
+    )
+    parser.add_argument(
+        "--max-packages",
+        type=int,
+        help="with --schedule, check at most this many packages per run",
+    )
+    parser.add_argument(
+        "--request-budget",
+        type=int,
+        help="stop starting checks once this many requests were made (multiple packages only)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="number of packages to check concurrently (multiple packages only)",
+    )
+    parser.add_argument(
+        "--output",
+        help="write combined JSON results for multiple packages to this file",
     )
     parser.add_argument(
         "--dry-run",
@@ -273,24 +760,205 @@ def get_parser():
     return parser
 
 
+def error_result(package_dir, error):
+    """
+    A result for a package that could not be checked.
+    """
+    return {
+        "package": os.path.basename(package_dir.rstrip(os.sep)),
+        "current": None,
+        "version": None,
+        "digest": None,
+        "status": "error",
+        "error": str(error),
+    }
+
+
+def skipped_result(package_dir):
+    """
+    A result for a package that was not checked this time.
+    """
+    result = error_result(package_dir, None)
+    result.update({"status": "skipped", "error": None})
+    return result
+
+
+def check_package(updater, store=None):
+    """
+    Check one package of many, returning a result instead of exiting on error.
+    """
+    try:
+        result = updater.check()
+    except (SystemExit, Exception) as e:
+        result = error_result(updater.package_dir, e)
+    if store:
+        record_check(store, updater, result)
+    return result
+
+
+def record_check(store, updater, result):
+    """
+    Record a check, and the releases it saw for the release history.
+    """
+    store.record_check(result, updater.repo)
+    for release in updater.seen_releases:
+        store.record_release(
+            updater.repo, release["tag_name"], release.get("published_at")
+        )
+
+
+def check_packages(
+    package_dirs,
+    dry_run=False,
+    workers=4,
+    digests="use",
+    backfill=False,
+    store=None,
+    skip_hours=0,
+    scheduler=None,
+    request_budget=None,
+):
+    """
+    Check many packages for new releases with a bounded pool of threads.
+
+    The latest releases for all repositories are looked up first with batched
+    GraphQL queries, and results are returned in the order of package directories.
+    Packages checked within skip_hours (per the state store), or that are not
+    due per the scheduler, are skipped. With a request budget, checks are
+    started (most overdue first) until the client has made that many
+    requests, and the rest are skipped. Checks already running are finished.
+    """
+    start = client.client.requests
+    results = {}
+    updaters = []
+    for package_dir in package_dirs:
+        package = os.path.basename(package_dir.rstrip(os.sep))
+        if store and skip_hours and store.recently_checked(package, skip_hours):
+            print(f"{package} was checked in the last {skip_hours} hours, skipping.")
+            results[package_dir] = skipped_result(package_dir)
+            continue
+        try:
+            updaters.append(
+                PackageUpdater(package_dir, None, dry_run, digests, backfill)
+            )
+        except (SystemExit, Exception) as e:
+            results[package_dir] = error_result(package_dir, e)
+            if store:
+                store.record_check(results[package_dir])
+
+    if scheduler:
+        due = scheduler.select([(x.package, x.repo) for x in updaters])
+        for updater in updaters:
+            if updater.package not in due:
+                results[updater.package_dir] = skipped_result(updater.package_dir)
+        updaters = sorted(
+            [x for x in updaters if x.package in due],
+            key=lambda x: due.index(x.package),
+        )
+        print(f"{len(updaters)} packages are due for a check.")
+
+    # Repositories not found here fall back to REST in get_latest_release
+    if not backfill:
+        latest = releases.latest_releases([x.repo for x in updaters], headers)
+        for updater in updaters:
+            updater.latest_release = latest.get(updater.repo)
+
+    over_budget = []
+
+    def run(updater):
+        if request_budget is not None:
+            if client.client.requests - start >= request_budget:
+                over_budget.append(updater.package)
+                return skipped_result(updater.package_dir)
+        return check_package(updater, store)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            updater.package_dir: executor.submit(run, updater) for updater in updaters
+        }
+        for package_dir, future in futures.items():
+            results[package_dir] = future.result()
+    if over_budget:
+        print(
+            f"Request budget of {request_budget} reached, not checking: {' '.join(over_budget)}"
+        )
+    return [results[package_dir] for package_dir in package_dirs]
+
+
 def main():
 
     parser = get_parser()
 
     # If an error occurs while parsing the arguments, the interpreter will exit with value 2
     args, extra = parser.parse_known_args()
+    package_dirs = find_packages(args.packages)
 
     # Show args to the user
-    print("     package: %s" % args.package)
+    print("    packages: %s" % " ".join(package_dirs))
     print("        repo: %s" % args.repo)
     print("     dry-run: %s" % args.dry_run)
+    print("     digests: %s" % args.digests)
+    print("    backfill: %s" % args.backfill)
 
     # Allow the checker to derive repo from the url
     if args.repo == ".":
         args.repo = None
 
-    updater = PackageUpdater(args.package, args.repo, args.dry_run)
-    updater.check()
+    # Results are recorded for the next run (and update_package.py)
+    store = state.StateStore()
+    scheduler = None
+    if args.schedule:
+        scheduler = ReleaseScheduler(store, headers, args.max_packages)
+
+    # A single package directory keeps the original outputs
+    single = len(args.packages) == 1 and package_dirs == args.packages
+    if single:
+        updater = PackageUpdater(
+            package_dirs[0],
+            args.repo,
+            args.dry_run,
+            args.digests,
+            backfill=args.backfill,
+        )
+        if args.schedule and not scheduler.select([(updater.package, updater.repo)]):
+            print(f"{updater.package} is not due for a check, skipping.")
+            return
+        result = updater.check()
+        record_check(store, updater, result)
+        if result["version"]:
+            naked_version = result["version"].lstrip("v")
+            set_env_and_output("package", f"{result['package']}@{naked_version}")
+            set_env_and_output("digest", result["digest"])
+            set_env_and_output("version", result["version"])
+        return
+
+    if args.repo:
+        print(
+            "A repo cannot be used with multiple packages, deriving from package urls."
+        )
+
+    print("     workers: %s" % args.workers)
+    results = check_packages(
+        package_dirs,
+        args.dry_run,
+        args.workers,
+        args.digests,
+        args.backfill,
+        store,
+        args.skip_hours,
+        scheduler,
+        args.request_budget,
+    )
+    for result in results:
+        print(
+            "%-30s %-12s %s"
+            % (result["package"], result["status"], result["version"] or "")
+        )
+
+    if args.output:
+        with open(args.output, "w") as fd:
+            fd.write(json.dumps(results, indent=4))
+    set_output("results", json.dumps(results))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import subprocess
+
+from package_graph import PackageGraph
+
+# Find the packages affected by the changes in a git range: packages with changed
+# files (package.py, patches, ...), and the packages here that depend on them.
+# The result is a matrix for strategy.matrix, so a push that changes one package
+# only runs jobs for that package and its dependents.
+# python scripts/affected_packages.py origin/main...HEAD
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description="Spack Updater Affected Packages",
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    parser.add_argument(
+        "range",
+        nargs="?",
+        default="HEAD~1..HEAD",
+        help="git range to compare (defaults to HEAD~1..HEAD)",
+    )
+    parser.add_argument(
+        "--repo",
+        help="repository with packages directory (defaults to PWD)",
+        default=os.getcwd(),
+    )
+    parser.add_argument(
+        "--all-paths",
+        nargs="*",
+        default=["repo.yaml"],
+        help="paths that affect every package (defaults to repo.yaml)",
+    )
+    parser.add_argument(
+        "--no-dependents",
+        dest="dependents",
+        action="store_false",
+        default=True,
+        help="do not add packages that depend on the changed packages",
+    )
+    parser.add_argument("--output", help="write the result to this json file")
+    return parser
+
+
+def changed_paths(repo, git_range):
+    """
+    Get paths changed in a git range (both sides of renames), relative to the repo.
+
+    None is returned if the range can't be resolved (e.g., the first push
+    of a branch has an all zero before commit).
+    """
+    cmd = ["git", "-c", "core.quotepath=off", "diff", "--name-only", "--no-renames"]
+    cmd += ["--relative"]
+    out = subprocess.run(
+        cmd + [git_range, "--"],
+        cwd=repo,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    if out.returncode != 0:
+        print(out.stderr.decode("utf-8").strip())
+        return
+    return [x for x in out.stdout.decode("utf-8").split("\n") if x]
+
+
+def affected_packages(graph, paths, all_paths=None, dependents=True):
+    """
+    Map changed paths to packages, and add their dependents here.
+
+    Paths are relative to the repository root (packages/<name>/...). Packages
+    that were removed are listed separately, since there is nothing to build.
+    """
+    result = {"changed": [], "dependents": [], "removed": []}
+    prefix = os.path.relpath(graph.root, graph.repo) + "/"
+    changed = set()
+    for path in paths:
+        if path in (all_paths or []):
+            print(f"{path} changed, all packages are affected.")
+            changed.update(graph.packages)
+        elif path.startswith(prefix) and "/" in path[len(prefix) :]:
+            changed.add(path[len(prefix) :].split("/", 1)[0])
+
+    result["changed"] = sorted(x for x in changed if x in graph.packages)
+    result["removed"] = sorted(x for x in changed if x not in graph.packages)
+    if dependents:
+        result["dependents"] = graph.transitive_dependents(result["changed"])
+    result["packages"] = sorted(set(result["changed"]) | set(result["dependents"]))
+    return result
+
+
+def set_output(name, value):
+    output_file = os.environ.get("GITHUB_OUTPUT")
+    if output_file:
+        with open(output_file, "a") as fd:
+            fd.write(f"{name}={value}\n")
+
+
+def main():
+
+    parser = get_parser()
+
+    # If an error occurs while parsing the arguments, the interpreter will exit with value 2
+    args, extra = parser.parse_known_args()
+    graph = PackageGraph(args.repo)
+
+    paths = changed_paths(args.repo, args.range)
+    if paths is None:
+        print(f"Cannot compare {args.range}, all packages are affected.")
+        paths = [os.path.join("packages", x, "package.py") for x in graph.packages]
+    result = affected_packages(graph, paths, args.all_paths, args.dependents)
+
+    for key in ["changed", "dependents", "removed"]:
+        print("%12s: %s" % (key, " ".join(result[key])))
+
+    # An empty matrix is an error in GitHub Actions, so check count first
+    result["matrix"] = {"package": result["packages"]}
+    if args.output:
+        with open(args.output, "w") as fd:
+            fd.write(json.dumps(result, indent=4))
+    set_output("matrix", json.dumps(result["matrix"]))
+    set_output("packages", json.dumps(result["packages"]))
+    set_output("count", len(result["packages"]))
+
+
+if __name__ == "__main__":
+    main()
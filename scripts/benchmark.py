@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+
+import argparse
+import http.server
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+here = os.path.dirname(os.path.abspath(__file__))
+root = os.path.dirname(here)
+
+# Benchmark the release check and diff paths offline. A local stand-in for the
+# GitHub API (releases, tags, issues, graphql) and tarball downloads serves
+# synthetic data with configurable latency and sizes, for a synthetic packages/
+# tree of N packages and a fake spack git repository.
+# python scripts/benchmark.py --sizes 10 100 1000
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description="Spack Updater Benchmark",
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[10, 100, 1000],
+        help="numbers of packages to benchmark",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.02,
+        help="seconds of latency added to every response",
+    )
+    parser.add_argument(
+        "--tarball-size",
+        type=int,
+        default=1024 * 1024,
+        help="bytes in each release tarball",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=8,
+        help="workers for the release check",
+    )
+    parser.add_argument(
+        "--paths",
+        nargs="+",
+        choices=["release-check", "diff"],
+        default=["release-check", "diff"],
+        help="paths to benchmark",
+    )
+    parser.add_argument("--output", help="write JSON results to this file")
+    return parser
+
+
+def package_name(i):
+    """
+    Package names without digits (so they are never mistaken for versions).
+    """
+    name = ""
+    i += 1
+    while i:
+        i, remainder = divmod(i - 1, 26)
+        name = chr(ord("a") + remainder) + name
+    return f"pkg{name}"
+
+
+class Stats:
+    """
+    Count requests and bytes served by the stand-in.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = 0
+            self.bytes = 0
+            self.paths = {}
+
+    def add(self, kind, size):
+        with self.lock:
+            self.requests += 1
+            self.bytes += size
+            self.paths[kind] = self.paths.get(kind, 0) + 1
+
+
+class GitHubStandIn(http.server.BaseHTTPRequestHandler):
+    """
+    Serve synthetic GitHub API responses and tarballs.
+
+    Odd numbered packages have a newer release (1.1.0) than their package.py.
+    """
+
+    protocol_version = "HTTP/1.1"
+    stats = None
+    latency = 0
+    tarball_size = 0
+    chunk = b"\x1f\x8b" + os.urandom(64 * 1024 - 2)
+
+    def log_message(self, *args):
+        pass
+
+    def latest_tag(self, name):
+        index = int(self.server.packages.get(name, 0))
+        return "v1.1.0" if index % 2 else "v1.0.0"
+
+    def send_json(self, kind, data, status=200):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", '"%s"' % hash(body))
+        self.send_header("X-RateLimit-Remaining", "5000")
+        self.send_header("X-RateLimit-Reset", str(int(time.time()) + 3600))
+        self.end_headers()
+        self.wfile.write(body)
+        self.stats.add(kind, len(body))
+
+    def send_tarball(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/gzip")
+        self.send_header("Content-Length", str(self.tarball_size))
+        self.end_headers()
+        remaining = self.tarball_size
+        while remaining:
+            data = self.chunk[: min(remaining, len(self.chunk))]
+            self.wfile.write(data)
+            remaining -= len(data)
+        self.stats.add("tarball", self.tarball_size)
+
+    def do_HEAD(self):
+        time.sleep(self.latency)
+        self.send_response(200)
+        self.send_header("Content-Length", str(self.tarball_size))
+        self.end_headers()
+        self.stats.add("head", 0)
+
+    def do_GET(self):
+        time.sleep(self.latency)
+
+        # Requests through the proxy have the full url
+        path = urllib.parse.urlparse(self.path).path
+        parts = path.strip("/").split("/")
+        if path.endswith(".tar.gz"):
+            return self.send_tarball()
+        if parts[0] != "repos" or len(parts) < 4:
+            return self.send_json("not-found", {"message": "Not Found"}, 404)
+
+        name = parts[2]
+        tag = self.latest_tag(name)
+        if parts[3:] == ["releases", "latest"]:
+            return self.send_json("release", {"tag_name": tag, "name": tag})
+        if parts[3:] == ["releases"]:
+            tags = ["v1.1.0", "v1.0.0"] if tag == "v1.1.0" else ["v1.0.0"]
+            return self.send_json("releases", [{"tag_name": x} for x in tags])
+        if parts[3:] == ["tags"]:
+            return self.send_json("tags", [{"name": tag}])
+        if parts[3:] == ["issues"]:
+            return self.send_json("issues", [])
+        self.send_json("not-found", {"message": "Not Found"}, 404)
+
+    def do_POST(self):
+        time.sleep(self.latency)
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        if urllib.parse.urlparse(self.path).path != "/graphql":
+            return self.send_json("issue", {"number": 1, "html_url": "issue"}, 201)
+
+        # One aliased repository per owner/name variable pair
+        data = {}
+        variables = payload.get("variables") or {}
+        for key, name in variables.items():
+            if key.startswith("name"):
+                tag = self.latest_tag(name)
+                data["r" + key[len("name") :]] = {
+                    "latestRelease": {
+                        "tagName": tag,
+                        "name": tag,
+                        "isDraft": False,
+                        "isPrerelease": False,
+                        "publishedAt": None,
+                    }
+                }
+        self.send_json("graphql", {"data": data})
+
+
+def start_server(stats, latency, tarball_size):
+    handler = type(
+        "Handler",
+        (GitHubStandIn,),
+        {"stats": stats, "latency": latency, "tarball_size": tarball_size},
+    )
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    server.packages = {}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def git(*args, cwd=None, env=None):
+    subprocess.run(
+        ["git"] + list(args), cwd=cwd, env=env, check=True, stdout=subprocess.DEVNULL
+    )
+
+
+def commit(path, message, timestamp):
+    env = dict(os.environ)
+    env.update(
+        {
+            "GIT_AUTHOR_NAME": "benchmark",
+            "GIT_AUTHOR_EMAIL": "benchmark@example.com",
+            "GIT_COMMITTER_NAME": "benchmark",
+            "GIT_COMMITTER_EMAIL": "benchmark@example.com",
+            "GIT_AUTHOR_DATE": "%s +0000" % timestamp,
+            "GIT_COMMITTER_DATE": "%s +0000" % timestamp,
+        }
+    )
+    git("add", ".", cwd=path, env=env)
+    # Small trees may have nothing changed in a step
+    status = subprocess.run(
+        ["git", "status", "--porcelain"], cwd=path, capture_output=True, text=True
+    )
+    if status.stdout.strip():
+        git("commit", "-q", "-m", message, cwd=path, env=env)
+
+
+def package_content(name, version="1.0.0"):
+    return f'''from spack.package import *
+
+
+class {name.capitalize()}(Package):
+    """A synthetic package for benchmarks."""
+
+    homepage = "http://github.com/org/{name}"
+    url = "http://github.com/org/{name}/archive/{version}.tar.gz"
+
+    version("{version}", sha256="{'0' * 64}")
+
+    depends_on("zlib")
+'''
+
+
+def create_tree(base, count, server):
+    """
+    Create a local repository with packages/ and a fake spack repository.
+
+    A third of the packages are changed here (newer), and a third in spack.
+    """
+    repo = os.path.join(base, "repo")
+    spack = os.path.join(base, "spack")
+    spack_packages = os.path.join(spack, "var", "spack", "repos", "builtin", "packages")
+    for i in range(count):
+        name = package_name(i)
+        server.packages[name] = i
+        for path in [
+            os.path.join(repo, "packages", name),
+            os.path.join(spack_packages, name),
+        ]:
+            os.makedirs(path)
+            with open(os.path.join(path, "package.py"), "w") as fd:
+                fd.write(package_content(name))
+    os.makedirs(os.path.join(spack, "lib"))
+    with open(os.path.join(spack, "lib", "README"), "w") as fd:
+        fd.write("fake spack\n")
+
+    now = int(time.time())
+    for path in [repo, spack]:
+        git("init", "-q", "-b", "develop", cwd=path)
+        commit(path, "initial", now - 3600)
+
+    # Changes here are newer than spack, and changes in spack newer still
+    for i in range(count):
+        name = package_name(i)
+        if i % 3 == 1:
+            with open(os.path.join(repo, "packages", name, "fix.patch"), "w") as fd:
+                fd.write("local patch\n")
+        elif i % 3 == 2:
+            with open(os.path.join(spack_packages, name, "package.py"), "a") as fd:
+                fd.write("    # upstream change\n")
+    commit(repo, "local changes", now - 1800)
+    commit(spack, "upstream changes", now - 60)
+    return repo, spack
+
+
+def run(cmd, cwd, env):
+    """
+    Run a command, returning wall time and peak RSS (in KiB) of the process.
+    """
+    start = time.time()
+    with open(os.devnull, "w") as devnull:
+        proc = subprocess.Popen(cmd, cwd=cwd, env=env, stdout=devnull, stderr=devnull)
+        _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return {
+        "wall_seconds": round(time.time() - start, 3),
+        "peak_rss_kb": usage.ru_maxrss,
+        "exit_code": proc.returncode,
+    }
+
+
+def benchmark(count, args, stats):
+    """
+    Benchmark release check and diff paths for a number of packages.
+    """
+    server = start_server(stats, args.latency, args.tarball_size)
+    address = "http://127.0.0.1:%s" % server.server_address[1]
+    base = tempfile.mkdtemp(prefix="spack-updater-benchmark-")
+    results = []
+    try:
+        repo, spack = create_tree(base, count, server)
+        env = dict(os.environ)
+        env.update(
+            {
+                "GITHUB_TOKEN": "benchmark",
+                "GITHUB_API_URL": address,
+                "GITHUB_SERVER_URL": "http://github.com",
+                "HTTP_PROXY": address,
+                "http_proxy": address,
+                "NO_PROXY": "127.0.0.1",
+                "no_proxy": "127.0.0.1",
+            }
+        )
+        for env_var in ["GITHUB_ENV", "GITHUB_OUTPUT", "GITHUB_REPOSITORY"]:
+            env.pop(env_var, None)
+
+        commands = {
+            "release-check": [
+                sys.executable,
+                os.path.join(root, "release-check", "scripts", "get_releases.py"),
+                "--dry-run",
+                "--workers",
+                str(args.workers),
+                "packages",
+            ],
+            "diff": [
+                sys.executable,
+                os.path.join(root, "scripts", "update_package.py"),
+                "--all",
+                "--upstream",
+                spack,
+            ],
+        }
+
+        # A cold run starts with an empty cache, a warm run reuses it
+        for path in args.paths:
+            env["SPACK_UPDATER_CACHE"] = os.path.join(base, "cache-" + path)
+            for cache in ["cold", "warm"]:
+                subprocess.run(["git", "checkout", "-q", "."], cwd=repo)
+                subprocess.run(["git", "clean", "-qfd"], cwd=repo)
+                stats.reset()
+                result = run(commands[path], repo, env)
+                result.update(
+                    {
+                        "path": path,
+                        "packages": count,
+                        "cache": cache,
+                        "requests": stats.requests,
+                        "bytes": stats.bytes,
+                        "requests_by_kind": dict(stats.paths),
+                    }
+                )
+                results.append(result)
+                print(
+                    "%-14s %6s %-5s %9.3fs %7s requests %12s bytes %8s KiB exit %s"
+                    % (
+                        path,
+                        count,
+                        cache,
+                        result["wall_seconds"],
+                        result["requests"],
+                        result["bytes"],
+                        result["peak_rss_kb"],
+                        result["exit_code"],
+                    )
+                )
+    finally:
+        server.shutdown()
+        shutil.rmtree(base, ignore_errors=True)
+    return results
+
+
+def main():
+
+    parser = get_parser()
+
+    # If an error occurs while parsing the arguments, the interpreter will exit with value 2
+    args, extra = parser.parse_known_args()
+
+    # Show args to the user
+    print("       sizes: %s" % " ".join(str(x) for x in args.sizes))
+    print("     latency: %s" % args.latency)
+    print("tarball-size: %s" % args.tarball_size)
+    print("     workers: %s" % args.workers)
+
+    stats = Stats()
+    results = []
+    for count in args.sizes:
+        results += benchmark(count, args, stats)
+
+    if args.output:
+        with open(args.output, "w") as fd:
+            fd.write(json.dumps(results, indent=4))
+
+
+if __name__ == "__main__":
+    main()
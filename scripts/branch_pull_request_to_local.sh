@@ -10,7 +10,16 @@ git config --global user.email "github-actions@users.noreply.github.com"
 repo_path=$(realpath "${repo}")
 tree ${repo_path}
 repo_path=${repo_path}/packages/${package}
-git add $repo_path/*
+
+# The spack updater reports how many files it staged (unset means unknown)
+if [ "${spack_updater_changes}" == "0" ]; then
+    printf "No changes\n"
+    echo "PULL_REQUEST_FROM_BRANCH=${BRANCH_FROM}" >> $GITHUB_ENV
+    exit 0
+fi
+
+# Stage removed files too
+git add -A -- $repo_path
 if git diff-index --quiet HEAD --; then
     printf "No changes\n"
 else
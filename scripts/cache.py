@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+import requests
+
+import client
+
+# Caches shared by the updater scripts. The cache root can be restored
+# between workflow runs (e.g., with actions/cache) to skip repeated work.
+# export SPACK_UPDATER_CACHE=${{ runner.temp }}/spack-updater-cache
+
+
+def cache_dir(*subdirs):
+    """
+    Get (and create) a directory under the spack updater cache root.
+    """
+    root = os.environ.get("SPACK_UPDATER_CACHE") or os.path.join(
+        os.path.expanduser("~"), ".cache", "spack-updater"
+    )
+    path = os.path.join(root, *subdirs)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def write_json(data, filename):
+    """
+    Write json to file atomically, so concurrent readers never see partial content.
+    """
+    fd, tmpfile = tempfile.mkstemp(dir=os.path.dirname(filename), suffix=".tmp")
+    with os.fdopen(fd, "w") as fh:
+        fh.write(json.dumps(data))
+    os.replace(tmpfile, filename)
+
+
+def read_json(filename):
+    """
+    Read json from file, returning None if it is missing or corrupt.
+    """
+    try:
+        with open(filename, "r") as fd:
+            return json.loads(fd.read())
+    except (OSError, ValueError):
+        return None
+
+
+class HttpCache:
+    """
+    An on-disk cache of GET responses that revalidates with ETag / Last-Modified.
+
+    A 304 Not Modified response is served from disk (and does not count
+    against the GitHub API rate limit). The least recently used entries
+    are evicted when the cache grows beyond max_bytes.
+    """
+
+    def __init__(self, root=None, max_bytes=100 * 1024 * 1024):
+        self._root = root
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def root(self):
+        """
+        Resolve the cache directory on first use.
+        """
+        if not self._root:
+            self._root = cache_dir("http")
+        return self._root
+
+    def key(self, url, headers=None, params=None):
+        """
+        Responses vary by url, query, and the headers that change content.
+
+        The token itself is new for each workflow job, so an authenticated
+        request is keyed on the repository it is for (what the token can see)
+        instead, and an entry saved in one run is revalidated in the next.
+        """
+        headers = headers or {}
+        parts = [url, json.dumps(params or {}, sort_keys=True)]
+        parts.append(headers.get("Accept") or "")
+        if headers.get("Authorization"):
+            parts.append("token:%s" % os.environ.get("GITHUB_REPOSITORY", ""))
+        else:
+            parts.append("")
+        return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+    def paths(self, key):
+        base = os.path.join(self.root, key)
+        return base + ".json", base + ".body"
+
+    def get(self, url, headers=None, params=None, session=None, **kwargs):
+        """
+        Perform a conditional GET, returning a requests.Response.
+        """
+        session = session or client
+        headers = dict(headers or {})
+        meta_file, body_file = self.paths(self.key(url, headers, params))
+        meta = read_json(meta_file)
+        if meta and os.path.exists(body_file):
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        response = session.get(url, headers=headers, params=params, **kwargs)
+        if response.status_code == 304 and meta:
+            cached = self.load(url, meta, body_file)
+            if cached is not None:
+                self.hits += 1
+                return cached
+
+        self.misses += 1
+        if response.status_code == 200:
+            self.save(response, meta_file, body_file)
+        return response
+
+    def load(self, url, meta, body_file):
+        """
+        Load a cached response from disk.
+        """
+        try:
+            with open(body_file, "rb") as fd:
+                content = fd.read()
+        except OSError:
+            return None
+
+        # Mark as recently used for eviction
+        os.utime(body_file)
+        response = requests.Response()
+        response.status_code = 200
+        response.url = url
+        response.headers.update(meta.get("headers") or {})
+        response.encoding = meta.get("encoding")
+        response._content = content
+        return response
+
+    def save(self, response, meta_file, body_file):
+        """
+        Save a response with validators to disk.
+        """
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if not etag and not last_modified:
+            return
+        meta = {
+            "url": response.url,
+            "etag": etag,
+            "last_modified": last_modified,
+            "encoding": response.encoding,
+            "headers": {
+                k: v
+                for k, v in response.headers.items()
+                if k.lower() in ["content-type", "link", "etag", "last-modified"]
+            },
+            "stored": time.time(),
+        }
+        fd, tmpfile = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(response.content)
+        os.replace(tmpfile, body_file)
+        write_json(meta, meta_file)
+        self.prune()
+
+    def prune(self):
+        """
+        Evict least recently used entries until we are under max_bytes.
+        """
+        with self.lock:
+            entries = []
+            total = 0
+            for name in os.listdir(self.root):
+                if not name.endswith(".body"):
+                    continue
+                path = os.path.join(self.root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                for filename in [path, path[: -len(".body")] + ".json"]:
+                    if os.path.exists(filename):
+                        os.remove(filename)
+                total -= size
+
+
+class DigestCache:
+    """
+    A persistent index of url -> size, sha256, etag, and timestamps.
+
+    This lets us skip downloading an unchanged release just to hash it.
+    The least recently used entries are pruned beyond max_entries.
+    """
+
+    def __init__(self, filename=None, max_entries=2000):
+        self._filename = filename
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+
+    @property
+    def filename(self):
+        """
+        Resolve the index file on first use.
+        """
+        if not self._filename:
+            self._filename = os.path.join(cache_dir("digests"), "index.json")
+        return self._filename
+
+    def load(self):
+        return read_json(self.filename) or {}
+
+    def get(self, url):
+        """
+        Get a cached entry for a url, marking it as recently used.
+        """
+        with self.lock:
+            index = self.load()
+            entry = index.get(url)
+            if entry:
+                entry["used"] = time.time()
+                write_json(index, self.filename)
+            return entry
+
+    def set(self, url, size, sha256, etag=None):
+        """
+        Record the digest for a url.
+        """
+        with self.lock:
+            index = self.load()
+            now = time.time()
+            index[url] = {
+                "size": size,
+                "sha256": sha256,
+                "etag": etag,
+                "stored": now,
+                "used": now,
+            }
+            index = self.prune(index)
+            write_json(index, self.filename)
+
+    def remove(self, url):
+        with self.lock:
+            index = self.load()
+            if index.pop(url, None):
+                write_json(index, self.filename)
+
+    def prune(self, index):
+        """
+        Keep only the max_entries most recently used entries.
+        """
+        if len(index) <= self.max_entries:
+            return index
+        keep = sorted(index, key=lambda url: index[url].get("used", 0))
+        keep = keep[-self.max_entries :]
+        return {url: index[url] for url in keep}
+
+
+class UrlPatterns:
+    """
+    Remember which download url pattern (package_url, release, archive) worked per package.
+    """
+
+    def __init__(self, filename=None):
+        self._filename = filename
+        self.lock = threading.Lock()
+
+    @property
+    def filename(self):
+        if not self._filename:
+            self._filename = os.path.join(cache_dir("digests"), "patterns.json")
+        return self._filename
+
+    def get(self, package):
+        with self.lock:
+            return (read_json(self.filename) or {}).get(package)
+
+    def set(self, package, pattern):
+        with self.lock:
+            patterns = read_json(self.filename) or {}
+            if patterns.get(package) != pattern:
+                patterns[package] = pattern
+                write_json(patterns, self.filename)
+
+
+# A default cache shared by the module-level helper
+http_cache = HttpCache()
+digest_cache = DigestCache()
+url_patterns = UrlPatterns()
+
+
+def get(url, headers=None, params=None, **kwargs):
+    """
+    Conditional GET using the default http cache.
+    """
+    return http_cache.get(url, headers=headers, params=params, **kwargs)
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+
+import os
+import random
+import threading
+import time
+import urllib.parse
+
+import requests
+import requests.adapters
+
+# A shared HTTP client for the updater scripts. Connections are pooled, transient
+# errors are retried with backoff and jitter, concurrent requests per host are
+# limited, and when the GitHub rate limit runs out we wait for the reset instead
+# of failing, so a large batch run finishes within the hourly budget.
+
+# GitHub Actions sets these (e.g., for GitHub Enterprise), and a benchmark can
+# point them at a local stand-in
+api_url = os.environ.get("GITHUB_API_URL") or "https://api.github.com"
+server_url = os.environ.get("GITHUB_SERVER_URL") or "https://github.com"
+
+# Status codes that are worth trying again
+retry_status = [429, 500, 502, 503, 504]
+
+# Seconds to wait to connect, and between bytes of a response, before giving up
+# (a stalled connection would otherwise hang until the job times out)
+timeout = (10, 60)
+
+# Methods that are safe to send again after a server error
+idempotent_methods = ["GET", "HEAD", "PATCH", "PUT", "DELETE", "OPTIONS"]
+
+
+def guess_resource(url):
+    """
+    Guess the rate limit resource of a request, before the response says.
+    """
+    path = urllib.parse.urlparse(url).path
+    if path.endswith("/graphql"):
+        return "graphql"
+    if "/search/" in path:
+        return "search"
+    return "core"
+
+
+class RateLimit:
+    """
+    Track the rate limit reported by a host (X-RateLimit-Remaining / Reset).
+    """
+
+    def __init__(self):
+        self.remaining = None
+        self.reset = None
+        self.lock = threading.Lock()
+
+    def update(self, response):
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        reset = response.headers.get("X-RateLimit-Reset")
+        if remaining is None or reset is None:
+            return
+        with self.lock:
+            self.remaining = int(remaining)
+            self.reset = int(reset)
+
+    def wait_time(self, reserve=0):
+        """
+        Seconds to wait before the next request, if we are out of requests.
+        """
+        with self.lock:
+            if self.remaining is None or self.remaining > reserve:
+                return 0
+            return max(self.reset - time.time() + 1, 0)
+
+    def take(self):
+        """
+        Count a request against what we know remains.
+        """
+        with self.lock:
+            if self.remaining:
+                self.remaining -= 1
+
+
+class Client:
+    """
+    A pooled session with retries, backoff and per-host rate limit awareness.
+    """
+
+    def __init__(
+        self,
+        retries=5,
+        backoff=1.0,
+        max_backoff=60,
+        max_per_host=8,
+        max_wait=3600,
+        reserve=0,
+        timeout=timeout,
+    ):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_per_host = max_per_host
+        self.max_wait = max_wait
+        self.reserve = reserve
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=16, pool_maxsize=max_per_host
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self.lock = threading.Lock()
+        self.hosts = {}
+        self.limits = {}
+        self.requests = 0
+
+    def host_semaphore(self, host):
+        with self.lock:
+            if host not in self.hosts:
+                self.hosts[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self.hosts[host]
+
+    def rate_limit(self, host, resource="core"):
+        """
+        Get the rate limit for a resource of a host.
+
+        GitHub counts some resources (e.g., core, graphql, search) separately,
+        so running out of one doesn't pause requests for another.
+        """
+        key = (host, resource)
+        with self.lock:
+            if key not in self.limits:
+                self.limits[key] = RateLimit()
+            return self.limits[key]
+
+    def sleep(self, attempt, response=None):
+        """
+        Sleep with exponential backoff and jitter, honoring Retry-After.
+        """
+        retry_after = None
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            seconds = int(retry_after)
+        else:
+            seconds = min(self.backoff * 2**attempt, self.max_backoff)
+            seconds = random.uniform(seconds / 2, seconds)
+        time.sleep(seconds)
+
+    def is_rate_limited(self, response):
+        """
+        GitHub returns a 403 (or 429) when the primary or secondary limit is hit.
+        """
+        if response.status_code not in [403, 429]:
+            return False
+        return (
+            response.headers.get("X-RateLimit-Remaining") == "0"
+            or "Retry-After" in response.headers
+        )
+
+    def wait_for_rate_limit(self, limit):
+        """
+        Pause until the rate limit resets, instead of failing.
+        """
+        seconds = limit.wait_time(self.reserve)
+        if not seconds:
+            return
+        if seconds > self.max_wait:
+            raise ValueError(
+                "Rate limit resets in %ss, longer than we will wait." % int(seconds)
+            )
+        print("Rate limit reached, waiting %ss for reset." % int(seconds))
+        time.sleep(seconds)
+
+    def request(self, method, url, **kwargs):
+        """
+        Send a request, retrying transient errors and waiting out rate limits.
+
+        Only idempotent methods are sent again after an error, unless the
+        caller says the request is (e.g., a GraphQL query with POST).
+        """
+        method = method.upper()
+        idempotent = kwargs.pop("idempotent", method in idempotent_methods)
+        kwargs.setdefault("timeout", self.timeout)
+        host = urllib.parse.urlparse(url).netloc
+        limit = self.rate_limit(host, guess_resource(url))
+        attempt = 0
+        while True:
+            self.wait_for_rate_limit(limit)
+            try:
+                with self.host_semaphore(host):
+                    limit.take()
+                    with self.lock:
+                        self.requests += 1
+                    response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                # A request that was sent may have been done (e.g., an issue opened)
+                sent = not isinstance(e, requests.ConnectTimeout)
+                if attempt >= self.retries or (sent and not idempotent):
+                    raise
+                self.sleep(attempt)
+                attempt += 1
+                continue
+
+            resource = response.headers.get("X-RateLimit-Resource")
+            if resource:
+                limit = self.rate_limit(host, resource)
+            limit.update(response)
+            if attempt >= self.retries:
+                return response
+
+            if self.is_rate_limited(response):
+                response.close()
+                if response.headers.get("X-RateLimit-Remaining") != "0":
+                    self.sleep(attempt, response)
+                attempt += 1
+                continue
+
+            if response.status_code in retry_status and (
+                idempotent or response.status_code == 429
+            ):
+                print(
+                    "Retrying %s %s after status %s"
+                    % (method, url, response.status_code)
+                )
+                response.close()
+                self.sleep(attempt, response)
+                attempt += 1
+                continue
+            return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request("HEAD", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request("PATCH", url, **kwargs)
+
+
+# A default client shared by the module-level helpers
+client = Client()
+
+
+def get(url, **kwargs):
+    return client.get(url, **kwargs)
+
+
+def head(url, **kwargs):
+    return client.head(url, **kwargs)
+
+
+def post(url, **kwargs):
+    return client.post(url, **kwargs)
+
+
+def patch(url, **kwargs):
+    return client.patch(url, **kwargs)
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import cache
+import client
+
+# Reconcile open issues with the issues we want open. All open issues are listed
+# once (every page) into an index by title, and the issues we want are compared
+# with it to find the few changes needed: create what is missing, update a body or
+# labels that changed, and close duplicates and issues we no longer want. Bodies
+# are composed before anything is sent, so each change is a single request.
+# reconciler = IssueReconciler("flux-framework/spack", headers)
+# reconciler.reconcile({title: {"body": body}, old_title: None})
+
+# Issues are changed concurrently (GitHub discourages many parallel writes)
+max_workers = 4
+
+
+def list_issues(repo, headers):
+    """
+    List the open issues (not pull requests) of a repository, a page at a time.
+    """
+    url = f"{client.api_url}/repos/{repo}/issues"
+    params = {"state": "open", "per_page": 100}
+    issues = []
+    while url:
+        response = cache.get(url, headers=headers, params=params)
+        if response.status_code != 200:
+            sys.exit("Issue retrieving open issues: %s" % response.status_code)
+        issues += [x for x in response.json() if "pull_request" not in x]
+        url = response.links.get("next", {}).get("url")
+        params = None
+    return issues
+
+
+class IssueReconciler:
+    """
+    Create, update and close issues so the open issues match a desired state.
+    """
+
+    def __init__(self, repo, headers, dry_run=False):
+        self.repo = repo
+        self.headers = headers
+        self.dry_run = dry_run or not repo
+        self._index = None
+
+    @property
+    def index(self):
+        """
+        Open issues by (stripped) title, oldest first, listed on first use.
+        """
+        if self._index is None:
+            self._index = {}
+            issues = list_issues(self.repo, self.headers) if self.repo else []
+            for issue in sorted(issues, key=lambda x: x["number"]):
+                self._index.setdefault(issue["title"].strip(), []).append(issue)
+        return self._index
+
+    def plan(self, desired):
+        """
+        Compare desired issues (title -> {"body", "labels"}, or None) with the index.
+
+        A title mapped to None should not have an open issue. The oldest open
+        issue with a title is kept (it has the discussion), and newer ones
+        with the same title are closed as duplicates.
+        """
+        operations = []
+        for title, spec in desired.items():
+            title = title.strip()
+            issues = self.index.get(title, [])
+            if spec is None:
+                operations += [self.close(x, "not needed") for x in issues]
+                continue
+
+            operations += [self.close(x, "duplicate") for x in issues[1:]]
+            if not issues:
+                operations.append(self.create(title, spec))
+                continue
+
+            issue = issues[0]
+            data = {}
+            if (issue.get("body") or "").strip() != spec["body"].strip():
+                data["body"] = spec["body"]
+            labels = [x["name"] for x in issue.get("labels", [])]
+            missing = [x for x in spec.get("labels", []) if x not in labels]
+            if missing:
+                data["labels"] = labels + missing
+            if data:
+                operations.append(
+                    {"op": "update", "title": title, "issue": issue, "data": data}
+                )
+        return operations
+
+    def create(self, title, spec):
+        data = {"title": title, "body": spec["body"]}
+        if spec.get("labels"):
+            data["labels"] = spec["labels"]
+        return {"op": "create", "title": title, "issue": None, "data": data}
+
+    def close(self, issue, reason):
+        return {
+            "op": "close",
+            "title": issue["title"].strip(),
+            "issue": issue,
+            "data": {"state": "closed"},
+            "reason": reason,
+        }
+
+    def apply(self, operation):
+        """
+        Send one operation, and return the issue.
+        """
+        url = f"{client.api_url}/repos/{self.repo}/issues"
+        data = json.dumps(operation["data"])
+        if operation["op"] == "create":
+            response = client.post(url, headers=self.headers, data=data)
+        else:
+            url += "/%s" % operation["issue"]["number"]
+            response = client.patch(url, headers=self.headers, data=data)
+        if response.status_code not in [200, 201]:
+            raise ValueError(
+                "Issue with %s of %s: %s, %s"
+                % (
+                    operation["op"],
+                    operation["title"],
+                    response.status_code,
+                    response.text,
+                )
+            )
+        return response.json()
+
+    def reconcile(self, desired):
+        """
+        Plan and apply the operations to reach the desired issues.
+
+        Returns the operations, each with the issue number and url (or the error).
+        """
+        operations = self.plan(desired)
+        if not operations:
+            print("Issues are up to date.")
+        for operation in operations:
+            number = "#%s" % operation["issue"]["number"] if operation["issue"] else ""
+            print("%-6s %-8s %s" % (operation["op"], number, operation["title"]))
+        if self.dry_run or not operations:
+            return operations
+
+        def run(operation):
+            try:
+                operation["result"] = self.apply(operation)
+                operation["number"] = operation["result"]["number"]
+                operation["url"] = operation["result"]["html_url"]
+            except Exception as e:
+                operation["error"] = str(e)
+            return operation
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            operations = list(executor.map(run, operations))
+
+        # Keep the index current for another call
+        for operation in operations:
+            if operation.get("error"):
+                print(operation["error"])
+                continue
+            issues = self.index.setdefault(operation["title"], [])
+            if operation["issue"]:
+                issues.remove(operation["issue"])
+            if operation["op"] != "close":
+                issues.insert(0, operation.pop("result"))
+        return operations
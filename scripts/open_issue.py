@@ -1,18 +1,11 @@
 #!/usr/bin/env python3
 
-import argparse
-import copy
-import json
 import os
-import re
-import shutil
-import subprocess
 import sys
-import tempfile
 import urllib.parse
 
-import requests
-import yaml
+import client
+from issues import IssueReconciler
 
 here = os.path.dirname(os.path.abspath(__file__))
 
@@ -35,20 +28,31 @@ print(f"From Branch: {from_branch}")
 print(f"Package: {package}")
 
 
-def has_issues(title):
+def issue_body(number=None):
     """
-    Given a new issue to be opened, return True if an issue is already open.
+    Compose the issue body, with a link to open the pull request.
+
+    The pull request says it will close the issue, so merging it closes the
+    request. The number of a new issue is only known once it is opened.
     """
-    url = "https://api.github.com/repos/%s/issues" % from_repository
-    response = requests.get(url, headers=headers)
-    if response.status_code != 200:
-        sys.exit("Issue retrieving previous issues.")
-    issues = response.json()
-    issues = [x for x in issues if "pull_request" not in x]
-    for issue in issues:
-        if issue["title"].strip() == title.strip():
-            return True
-    return False
+    body = "This is a request to open a pull request for a package update.\n\n"
+    if number is None:
+        return body
+    reference = urllib.parse.quote(
+        f"This will close {client.server_url}/{from_repository}/issues/{number}"
+    )
+    pull_url = f"{client.server_url}/{from_repository}/pull/new/{from_branch}?expand=1&body={reference}"
+    body += f"[Click here to open the pull request]({pull_url})"
+    return body
+
+
+def show(operations):
+    action = {"create": "Opened", "update": "Updated", "close": "Closed"}
+    for operation in operations:
+        if operation.get("error"):
+            sys.exit(operation["error"])
+        if operation.get("url"):
+            print("%s request issue:\n%s" % (action[operation["op"]], operation["url"]))
 
 
 def open_issue():
@@ -56,38 +60,24 @@ def open_issue():
     Open an issue with link to open a pull request.
     """
     title = f"[package-update] for {package}: {from_branch}"
-    body = "This is a request to open a pull request for a package update.\n\n"
 
-    # Ensure we don't open the same one twice
-    if has_issues(title):
-        print("An issue is already open for this branch update.")
-        return
-
-    # This is the url we assemble that will be provided in the issue to trigger an update workflow
-    url = f"https://api.github.com/repos/{from_repository}/issues"
-    print(url)
-    issue = {"title": title, "body": body}
-    print(issue)
-    response = requests.post(url, headers=headers, data=json.dumps(issue))
-    if response.status_code not in [200, 201]:
-        sys.exit("Issue making request: %s, %s" % (response.reason, response.json()))
-    # Show url to user
-    res = response.json()
-    print("Opened request issue:\n%s" % res["html_url"])
-
-    # Patch with the URL
-    number = res["number"]
-    reference = urllib.parse.quote(
-        f"This will close https://github.com/{from_repository}/issues/{number}"
-    )
-    issue_url = f"https://github.com/{from_repository}/pull/new/{from_branch}?expand=1&body={reference}"
-    body += f"[Click here to open the pull request]({issue_url})"
-    issue = {"body": body}
-    response = requests.patch(
-        url + "/" + str(number), headers=headers, data=json.dumps(issue)
-    )
-    res = response.json()
-    print("Patched issue with update link:\n%s" % res["html_url"])
+    # An open issue for the same branch is kept (and updated if needed)
+    reconciler = IssueReconciler(from_repository, headers)
+    issues = reconciler.index.get(title)
+    number = issues[0]["number"] if issues else None
+    operations = reconciler.reconcile({title: {"body": issue_body(number)}})
+    show(operations)
+
+    # A new issue gets the link with its number, in a single update
+    for operation in operations:
+        if operation["op"] == "create" and operation.get("number"):
+            update = {
+                "op": "update",
+                "title": title,
+                "issue": {"number": operation["number"]},
+                "data": {"body": issue_body(operation["number"])},
+            }
+            reconciler.apply(update)
 
 
 if __name__ == "__main__":
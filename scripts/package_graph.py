@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+
+import argparse
+import hashlib
+import json
+import os
+
+import package_index
+
+# The dependency graph of the packages here (packages/*/package.py), from their
+# depends_on() calls. Only dependencies that are also packages here are edges,
+# everything else comes from spack.
+# python scripts/package_graph.py --repo .
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description="Spack Updater Package Graph",
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    parser.add_argument(
+        "packages",
+        nargs="*",
+        help="packages to show (defaults to all)",
+    )
+    parser.add_argument(
+        "--repo",
+        help="repository with packages directory (defaults to PWD)",
+        default=os.getcwd(),
+    )
+    return parser
+
+
+class PackageGraph:
+    """
+    Local dependencies, dependents, layers and input hashes of packages.
+    """
+
+    def __init__(self, repo):
+        self.repo = os.path.abspath(repo)
+        self.root = os.path.join(self.repo, "packages")
+        self.packages = sorted(
+            name
+            for name in os.listdir(self.root)
+            if os.path.exists(os.path.join(self.root, name, "package.py"))
+        )
+        self.dependencies = {}
+        self.dependents = {name: [] for name in self.packages}
+        for name in self.packages:
+            index = package_index.get(
+                os.path.join(self.package_dir(name), "package.py")
+            )
+            deps = set(x["name"] for x in index.get("depends_on", []))
+            self.dependencies[name] = sorted(
+                x for x in deps if x in self.dependents and x != name
+            )
+            for dep in self.dependencies[name]:
+                self.dependents[dep].append(name)
+        self._content_hashes = {}
+        self._input_hashes = {}
+        self._visiting = set()
+
+    def package_dir(self, name):
+        return os.path.join(self.root, name)
+
+    def closure(self, names, edges):
+        """
+        Get everything reachable from some packages following edges (not the packages).
+        """
+        seen = set()
+        todo = list(names)
+        while todo:
+            for name in edges.get(todo.pop(), []):
+                if name not in seen:
+                    seen.add(name)
+                    todo.append(name)
+        return sorted(seen - set(names))
+
+    def transitive_dependencies(self, names):
+        return self.closure(names, self.dependencies)
+
+    def transitive_dependents(self, names):
+        return self.closure(names, self.dependents)
+
+    def layers(self, names=None):
+        """
+        Sort packages into layers, where each layer only depends on earlier ones.
+
+        Dependencies outside of the names given are assumed to be built already.
+        """
+        names = set(self.packages if names is None else names)
+        remaining = {
+            name: set(x for x in self.dependencies.get(name, []) if x in names)
+            for name in names
+        }
+        layers = []
+        while remaining:
+            layer = sorted(name for name, deps in remaining.items() if not deps)
+            if not layer:
+                raise ValueError(
+                    "Dependency cycle between packages: %s"
+                    % " ".join(sorted(remaining))
+                )
+            layers.append(layer)
+            for name in layer:
+                del remaining[name]
+            for deps in remaining.values():
+                deps.difference_update(layer)
+        return layers
+
+    def content_hash(self, name):
+        """
+        Hash the files (paths and content) of a package directory.
+        """
+        if name not in self._content_hashes:
+            package_dir = self.package_dir(name)
+            hasher = hashlib.sha256()
+            for root, dirs, files in os.walk(package_dir):
+                dirs.sort()
+                for filename in sorted(files):
+                    path = os.path.join(root, filename)
+                    hasher.update(os.path.relpath(path, package_dir).encode("utf-8"))
+                    with open(path, "rb") as fd:
+                        hasher.update(hashlib.sha256(fd.read()).digest())
+            self._content_hashes[name] = hasher.hexdigest()
+        return self._content_hashes[name]
+
+    def input_hash(self, name):
+        """
+        Hash a package directory with the input hashes of its local dependencies.
+
+        This changes when the package or anything it (transitively) depends on
+        here changes.
+        """
+        if name not in self._input_hashes:
+            if name in self._visiting:
+                raise ValueError(f"Dependency cycle at package {name}")
+            self._visiting.add(name)
+            hasher = hashlib.sha256(self.content_hash(name).encode("utf-8"))
+            for dep in self.dependencies[name]:
+                hasher.update(("%s:%s" % (dep, self.input_hash(dep))).encode("utf-8"))
+            self._visiting.discard(name)
+            self._input_hashes[name] = hasher.hexdigest()
+        return self._input_hashes[name]
+
+
+def main():
+
+    parser = get_parser()
+
+    # If an error occurs while parsing the arguments, the interpreter will exit with value 2
+    args, extra = parser.parse_known_args()
+    graph = PackageGraph(args.repo)
+    names = args.packages or graph.packages
+    result = {
+        "dependencies": {x: graph.dependencies[x] for x in names},
+        "dependents": {x: sorted(graph.dependents[x]) for x in names},
+        "layers": graph.layers(names),
+    }
+    print(json.dumps(result, indent=4))
+
+
+if __name__ == "__main__":
+    main()
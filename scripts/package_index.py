@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+
+import argparse
+import ast
+import hashlib
+import json
+import os
+import re
+
+from cache import cache_dir, read_json, write_json
+
+# Index the url, homepage, version() and depends_on() entries of package.py files
+# by parsing them with ast (so multi-line calls are found), and cache the result
+# on disk keyed by the file mtime and content hash.
+# python scripts/package_index.py packages/
+
+# Increment when the index format changes to invalidate cached entries
+index_format = 2
+
+# Keyword arguments of version() to keep
+version_keywords = ["sha256", "deprecated", "preferred", "branch", "tag", "commit"]
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description="Spack Updater Package Index",
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    parser.add_argument(
+        "packages",
+        nargs="+",
+        help="package directories or a directory of packages (e.g., packages/)",
+    )
+    return parser
+
+
+def literal(node):
+    """
+    Get the value of a literal node (string, number, bool) or None.
+    """
+    try:
+        return ast.literal_eval(node)
+    except ValueError:
+        return
+
+
+def parse_version(call):
+    """
+    Parse a version("1.2.3", sha256="...", ...) call.
+    """
+    if not call.args:
+        return
+    version = literal(call.args[0])
+    if version is None:
+        return
+    entry = {
+        "version": str(version),
+        "lineno": call.lineno,
+        "end_lineno": call.end_lineno,
+        "col_offset": call.col_offset,
+    }
+    for keyword in call.keywords:
+        if keyword.arg in version_keywords:
+            entry[keyword.arg] = literal(keyword.value)
+    return entry
+
+
+def parse_depends_on(call):
+    """
+    Parse a depends_on("name@version+variant", type=..., when=...) call.
+    """
+    if not call.args:
+        return
+    spec = literal(call.args[0])
+    if not isinstance(spec, str):
+        return
+    match = re.match("[a-zA-Z0-9_-]+", spec.strip())
+    if not match:
+        return
+    entry = {"name": match.group(), "spec": spec}
+    for keyword in call.keywords:
+        if keyword.arg in ["type", "when"]:
+            entry[keyword.arg] = literal(keyword.value)
+    return entry
+
+
+def parse_package(content):
+    """
+    Parse package.py content into an index of url, homepage, versions and dependencies.
+    """
+    index = {
+        "class": None,
+        "url": None,
+        "homepage": None,
+        "versions": [],
+        "depends_on": [],
+    }
+    tree = ast.parse(content)
+    for node in tree.body:
+        if not isinstance(node, ast.ClassDef):
+            continue
+        index["class"] = node.name
+        for item in node.body:
+            if isinstance(item, ast.Assign) and len(item.targets) == 1:
+                target = item.targets[0]
+                if isinstance(target, ast.Name) and target.id in ["url", "homepage"]:
+                    index[target.id] = literal(item.value)
+            elif isinstance(item, ast.Expr) and isinstance(item.value, ast.Call):
+                call = item.value
+                if isinstance(call.func, ast.Name) and call.func.id == "version":
+                    entry = parse_version(call)
+                    if entry:
+                        index["versions"].append(entry)
+
+        # Dependencies can be nested (e.g., in a with when(...) block)
+        for call in ast.walk(node):
+            if not isinstance(call, ast.Call) or not isinstance(call.func, ast.Name):
+                continue
+            if call.func.id == "depends_on":
+                entry = parse_depends_on(call)
+                if entry:
+                    index["depends_on"].append(entry)
+        break
+    return index
+
+
+class PackageIndex:
+    """
+    Parse package.py files, caching each index by file mtime and content hash.
+    """
+
+    def __init__(self, root=None):
+        self._root = root
+
+    @property
+    def root(self):
+        if not self._root:
+            self._root = cache_dir("packages")
+        return self._root
+
+    def cache_file(self, package_file):
+        key = hashlib.sha256(os.path.abspath(package_file).encode("utf-8"))
+        return os.path.join(self.root, key.hexdigest() + ".json")
+
+    def get(self, package_file):
+        """
+        Get the index for a package.py, parsing only if it changed.
+        """
+        stat = os.stat(package_file)
+        cache_file = self.cache_file(package_file)
+        cached = read_json(cache_file)
+        if cached and cached.get("format") == index_format:
+            if cached["mtime"] == stat.st_mtime and cached["size"] == stat.st_size:
+                return cached["index"]
+
+        with open(package_file, "rb") as fd:
+            content = fd.read()
+        digest = hashlib.sha256(content).hexdigest()
+        if cached and cached.get("format") == index_format:
+            if cached["hash"] == digest:
+                cached["mtime"] = stat.st_mtime
+                cached["size"] = stat.st_size
+                write_json(cached, cache_file)
+                return cached["index"]
+
+        index = parse_package(content.decode("utf-8"))
+        write_json(
+            {
+                "format": index_format,
+                "path": os.path.abspath(package_file),
+                "mtime": stat.st_mtime,
+                "size": stat.st_size,
+                "hash": digest,
+                "index": index,
+            },
+            cache_file,
+        )
+        return index
+
+
+# A default index shared by the module-level helper
+package_index = PackageIndex()
+
+
+def get(package_file):
+    return package_index.get(package_file)
+
+
+def main():
+
+    parser = get_parser()
+
+    # If an error occurs while parsing the arguments, the interpreter will exit with value 2
+    args, extra = parser.parse_known_args()
+
+    indexes = {}
+    for path in args.packages:
+        if os.path.exists(os.path.join(path, "package.py")):
+            names = [path]
+        else:
+            names = [os.path.join(path, x) for x in sorted(os.listdir(path))]
+        for package_dir in names:
+            package_file = os.path.join(package_dir, "package.py")
+            if os.path.exists(package_file):
+                indexes[os.path.basename(package_dir.rstrip(os.sep))] = get(
+                    package_file
+                )
+    print(json.dumps(indexes, indent=4))
+
+
+if __name__ == "__main__":
+    main()
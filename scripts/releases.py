@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+
+import re
+import threading
+
+import cache
+import client
+
+# Resolve the latest release (or tag) of repositories with the smallest responses
+# we can get: /releases/latest first, then short pages of tags. For many
+# repositories, a few GraphQL queries (one aliased repository field per
+# repository) replace one REST call each.
+
+api_url = client.api_url
+graphql_url = client.api_url + "/graphql"
+
+# Tags with a pre-release part after the version (e.g., v1.2.0-rc1, 2.0.0.dev3),
+# so names like source-1.2 or mercurial-6.1 are still releases
+prerelease_regex = re.compile(
+    r"[0-9][-._]?(alpha|beta|rc|dev|pre|preview)([-._]?[0-9]+)*$", re.IGNORECASE
+)
+
+# Resolved releases, per repository, for this run
+resolved = {}
+resolved_lock = threading.Lock()
+
+# Repositories per query, to stay well within GraphQL node and cost limits
+chunk_size = 50
+
+# The latest release is never a draft or pre-release
+release_fields = """
+    latestRelease { tagName name isDraft isPrerelease publishedAt }
+"""
+
+
+def chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+def build_query(repos):
+    """
+    Build one query with an aliased repository field (r0, r1, ...) per repo.
+    """
+    variables = {}
+    params = []
+    fields = []
+    for i, repo in enumerate(repos):
+        owner, name = repo.split("/", 1)
+        variables[f"owner{i}"] = owner
+        variables[f"name{i}"] = name
+        params += [f"$owner{i}: String!", f"$name{i}: String!"]
+        fields.append(
+            f"r{i}: repository(owner: $owner{i}, name: $name{i}) {{{release_fields}}}"
+        )
+    query = "query(%s) {\n%s\n}" % (", ".join(params), "\n".join(fields))
+    return query, variables
+
+
+def as_release(node):
+    """
+    Convert a GraphQL release node to the fields of the REST release.
+    """
+    return {
+        "tag_name": node["tagName"],
+        "name": node["name"],
+        "draft": node["isDraft"],
+        "prerelease": node["isPrerelease"],
+        "published_at": node["publishedAt"],
+    }
+
+
+def latest_releases(repos, headers, size=chunk_size):
+    """
+    Get the latest release for each repository (org/name).
+
+    Repositories that fail (or have no releases) are left out, so the
+    caller can fall back to the REST API for them.
+    """
+    found = {}
+    if not headers.get("Authorization"):
+        print("GraphQL requires a GITHUB_TOKEN, falling back to REST.")
+        return found
+
+    repos = sorted(set(repo for repo in repos if repo and "/" in repo))
+    for batch in chunks(repos, size):
+        query, variables = build_query(batch)
+        try:
+            response = client.post(
+                graphql_url,
+                headers=headers,
+                json={"query": query, "variables": variables},
+                idempotent=True,
+            )
+            response.raise_for_status()
+            data = response.json().get("data") or {}
+        except Exception as e:
+            print(f"GraphQL release lookup failed, falling back to REST: {e}")
+            continue
+
+        for i, repo in enumerate(batch):
+            node = (data.get(f"r{i}") or {}).get("latestRelease")
+            if node:
+                found[repo] = as_release(node)
+                with resolved_lock:
+                    resolved[repo] = found[repo]
+    print(f"Found latest releases for {len(found)} of {len(repos)} repositories.")
+    return found
+
+
+def version_key(tag):
+    """
+    Sort tags by the numbers in them (v1.10.0 > v1.9.2).
+    """
+    return [int(x) for x in re.findall("[0-9]+", tag)]
+
+
+def is_release_tag(tag):
+    return bool(re.search("[0-9]", tag)) and not prerelease_regex.search(tag)
+
+
+def latest_tag(repo, headers, per_page=30, max_pages=5):
+    """
+    Find the newest version-like tag, for projects that only push tags.
+
+    Tags are listed (small objects) a page at a time, stopping at the first
+    page that has a release-like tag.
+    """
+    url = f"{api_url}/repos/{repo}/tags"
+    params = {"per_page": per_page}
+    for _ in range(max_pages):
+        response = cache.get(url, headers=headers, params=params)
+        response.raise_for_status()
+        tags = [x["name"] for x in response.json() if is_release_tag(x["name"])]
+        if tags:
+            tag = max(tags, key=version_key)
+            return {"tag_name": tag, "name": tag, "draft": False, "prerelease": False}
+
+        url = response.links.get("next", {}).get("url")
+        if not url:
+            return
+        params = None
+
+
+def latest_release(repo, headers):
+    """
+    Get the latest (not draft, not pre-release) release or tag of a repository.
+    """
+    with resolved_lock:
+        if repo in resolved:
+            return resolved[repo]
+
+    # This is one release object, and 404 if there are no full releases
+    url = f"{api_url}/repos/{repo}/releases/latest"
+    response = cache.get(url, headers=headers)
+    release = None
+    if response.status_code == 200:
+        release = response.json()
+    elif response.status_code == 404:
+        print(f"No releases found for {repo}, looking for tags.")
+        release = latest_tag(repo, headers)
+    else:
+        response.raise_for_status()
+
+    if not release:
+        raise ValueError(f"No releases or tags found for {repo}")
+    with resolved_lock:
+        resolved[repo] = release
+    return release
+
+
+def releases_since(repo, headers, current, known=None, per_page=30, max_pages=10):
+    """
+    Get every release (not draft, not pre-release) newer than the current version.
+
+    Releases are paged newest first until we reach the current version. If there
+    are no releases, newer version-like tags are used. Releases are returned
+    newest first, and versions we already know about are skipped.
+    """
+    known = set(known or []) | {current}
+    newer = {}
+    url = f"{api_url}/repos/{repo}/releases"
+    params = {"per_page": per_page}
+    found_releases = False
+    for _ in range(max_pages):
+        response = cache.get(url, headers=headers, params=params)
+        response.raise_for_status()
+        page = response.json()
+        found_releases = found_releases or bool(page)
+        for release in page:
+            if release.get("draft") or release.get("prerelease"):
+                continue
+            newer[release["tag_name"]] = release
+        if any(x["tag_name"].lstrip("v") == current for x in page):
+            break
+        url = response.links.get("next", {}).get("url")
+        if not url:
+            break
+        params = None
+
+    # Projects that only push tags
+    if not found_releases:
+        print(f"No releases found for {repo}, looking for tags.")
+        url = f"{api_url}/repos/{repo}/tags"
+        params = {"per_page": 100}
+        for _ in range(max_pages):
+            response = cache.get(url, headers=headers, params=params)
+            response.raise_for_status()
+            for tag in response.json():
+                if is_release_tag(tag["name"]):
+                    newer[tag["name"]] = {"tag_name": tag["name"], "name": tag["name"]}
+            url = response.links.get("next", {}).get("url")
+            if not url:
+                break
+            params = None
+
+    current_key = version_key(current)
+    tags = [
+        tag
+        for tag in newer
+        if version_key(tag) > current_key and tag.lstrip("v") not in known
+    ]
+    return [newer[tag] for tag in sorted(tags, key=version_key, reverse=True)]
+
+
+def release_history(repo, headers, per_page=30):
+    """
+    Get the recent (not draft, not pre-release) releases of a repository, newest first.
+    """
+    url = f"{api_url}/repos/{repo}/releases"
+    response = cache.get(url, headers=headers, params={"per_page": per_page})
+    response.raise_for_status()
+    return [
+        x for x in response.json() if not x.get("draft") and not x.get("prerelease")
+    ]
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+import statistics
+import time
+
+import releases
+from state import completed_statuses
+
+# Decide which packages are due for a release check from how often their
+# repositories release. Repositories that release weekly are checked more often
+# than ones that release once a year, and as the expected next release gets
+# closer we check at the shortest interval. An optional budget limits the number
+# of packages checked per run, most overdue packages first.
+
+# Hours between checks are kept within these bounds
+min_hours = 24
+max_hours = 24 * 14
+
+# Hours between checks for repositories without enough history
+default_hours = 24
+
+# Check this many times per expected release interval
+checks_per_interval = 4
+
+# Check at min_hours once this fraction of the expected interval has passed
+due_fraction = 0.75
+
+# Number of recent intervals used to estimate the next
+history_size = 10
+
+# Scheduled runs drift, so a check is due this many hours early
+slack_hours = 2
+
+
+class ReleaseScheduler:
+    """
+    Select packages that are due for a release check, within a package budget.
+    """
+
+    def __init__(self, store, headers=None, budget=None, now=None):
+        self.store = store
+        self.headers = headers or {}
+        self.budget = budget
+        self.now = now or time.time()
+
+    def expected_interval(self, repo):
+        """
+        Estimate the hours between releases (the median of recent intervals).
+        """
+        times = self.store.release_times(repo)[-history_size - 1 :]
+        intervals = [(b - a) / 3600 for a, b in zip(times, times[1:]) if b > a]
+        if len(intervals) < 2:
+            return
+        return statistics.median(intervals)
+
+    def check_hours(self, repo):
+        """
+        Get the hours between checks for a repository.
+        """
+        interval = self.expected_interval(repo)
+        if not interval:
+            return default_hours
+        hours = min(max(interval / checks_per_interval, min_hours), max_hours)
+
+        # A release is expected soon
+        times = self.store.release_times(repo)
+        if (self.now - times[-1]) / 3600 >= interval * due_fraction:
+            hours = min_hours
+        return hours
+
+    def seed(self, repo):
+        """
+        Record recent releases of a repository we have never checked (one request).
+        """
+        try:
+            for release in releases.release_history(repo, self.headers):
+                self.store.record_release(
+                    repo, release["tag_name"], release.get("published_at")
+                )
+        except Exception as e:
+            print(f"Cannot get release history for {repo}: {e}")
+
+    def schedule(self, items):
+        """
+        Get the schedule for (package, repo) pairs, most overdue first.
+        """
+        schedule = []
+        for package, repo in items:
+            check = self.store.last_check(package)
+            entry = {
+                "package": package,
+                "repo": repo,
+                "interval_hours": None,
+                "check_hours": default_hours,
+                "overdue": float("inf"),
+            }
+
+            # Never checked, the history is looked up if it is selected
+            entry["seed"] = bool(
+                not check and repo and not self.store.release_times(repo)
+            )
+
+            if repo:
+                entry["interval_hours"] = self.expected_interval(repo)
+                entry["check_hours"] = self.check_hours(repo)
+
+            # A dry run didn't write what it found, and an error is retried now
+            completed = self.store.last_check(package, completed_statuses)
+            if completed and check["status"] != "error":
+                hours = (self.now - completed["checked_at"]) / 3600 + slack_hours
+                entry["overdue"] = hours / entry["check_hours"]
+            schedule.append(entry)
+        return sorted(schedule, key=lambda x: -x["overdue"])
+
+    def select(self, items):
+        """
+        Select the packages (names) that are due, within the package budget.
+        """
+        selected = []
+        over_budget = []
+        for entry in self.schedule(items):
+            if entry["overdue"] < 1:
+                continue
+            if self.budget is not None and len(selected) >= self.budget:
+                over_budget.append(entry["package"])
+                continue
+            if entry["seed"]:
+                self.seed(entry["repo"])
+            selected.append(entry["package"])
+        if over_budget:
+            print(
+                f"Budget of {self.budget} packages reached, not checking: {' '.join(over_budget)}"
+            )
+        return selected
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+
+from cache import cache_dir
+
+# Keep a local (bare, blobless) mirror of spack that is updated with incremental
+# fetches, and check out cheap worktrees from it. With a sparse list of paths only
+# the blobs for those paths are ever fetched.
+# python scripts/spack_mirror.py --dest /opt/spack
+
+# Mirrors can be kept outside the cache root, so one copy is cached for all
+# packages (defaults to the git directory of the cache root)
+# export SPACK_UPDATER_MIRROR=${{ runner.temp }}/spack-updater-mirror
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description="Spack Updater Mirror",
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    parser.add_argument(
+        "--upstream",
+        help="repository upstream to mirror",
+        default="https://github.com/spack/spack",
+    )
+    parser.add_argument(
+        "--branch",
+        help="branch to mirror",
+        default="develop",
+    )
+    parser.add_argument(
+        "--dest",
+        help="directory to check out a worktree to",
+        required=True,
+    )
+    parser.add_argument(
+        "--path",
+        dest="paths",
+        action="append",
+        help="limit the checkout to this path (can be repeated)",
+    )
+    return parser
+
+
+def mirror_dir():
+    """
+    Get (and create) the directory with mirrors.
+    """
+    path = os.environ.get("SPACK_UPDATER_MIRROR")
+    if not path:
+        return cache_dir("git")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class SpackMirror:
+    """
+    A persistent, incrementally updated mirror of a spack repository.
+    """
+
+    def __init__(self, upstream, branch="develop", root=None, depth=1):
+        # The user can provide just the org/reponame, or a local path
+        if os.path.exists(upstream):
+            upstream = "file://" + os.path.abspath(upstream)
+        elif not upstream.startswith(("http", "file://")):
+            upstream = f"https://github.com/{upstream}"
+        self.upstream = upstream
+        self.branch = branch
+        self.depth = depth
+        name = re.sub("[^A-Za-z0-9_.-]+", "-", upstream).strip("-")
+        self.root = root or os.path.join(mirror_dir(), name + ".git")
+
+    def git(self, *args, cwd=None):
+        cmd = ["git"] + list(args)
+        try:
+            subprocess.run(cmd, check=True, cwd=cwd or self.root)
+        except subprocess.CalledProcessError as e:
+            raise ValueError(f"Failed to run {' '.join(cmd)}:\n{e}")
+
+    @property
+    def ref(self):
+        return f"refs/heads/{self.branch}"
+
+    def depth_args(self):
+        if not self.depth:
+            return []
+        return ["--depth", str(self.depth)]
+
+    def update(self):
+        """
+        Create the mirror, or fetch only what changed since the last update.
+        """
+        if not os.path.exists(os.path.join(self.root, "HEAD")):
+            print(f"Creating mirror of {self.upstream} in {self.root}")
+            cmd = ["clone", "--bare", "--filter=blob:none", "--branch", self.branch]
+            self.git(*cmd, *self.depth_args(), self.upstream, self.root, cwd=".")
+            return
+
+        print(f"Updating mirror of {self.upstream} in {self.root}")
+        self.git("remote", "set-url", "origin", self.upstream)
+        self.git(
+            "fetch",
+            "--filter=blob:none",
+            *self.depth_args(),
+            "origin",
+            f"+{self.ref}:{self.ref}",
+        )
+        # Remove worktrees that were not cleaned up (e.g., a cancelled job)
+        self.git("worktree", "prune")
+
+    def checkout(self, dest=None, paths=None):
+        """
+        Check out a worktree of the mirrored branch, optionally sparse to paths.
+        """
+        dest = dest or tempfile.mkdtemp()
+        if os.path.exists(dest) and not os.listdir(dest):
+            os.rmdir(dest)
+        self.git("worktree", "add", "--no-checkout", "--detach", dest, self.ref)
+        if paths:
+            self.git("sparse-checkout", "set", "--cone", *paths, cwd=dest)
+        self.git("checkout", "--detach", self.ref, cwd=dest)
+        return dest
+
+    def remove(self, dest):
+        """
+        Remove a worktree (the mirror is kept).
+        """
+        if not os.path.exists(dest):
+            return
+        try:
+            self.git("worktree", "remove", "--force", dest)
+        except ValueError:
+            shutil.rmtree(dest)
+            self.git("worktree", "prune")
+
+
+def main():
+
+    parser = get_parser()
+
+    # If an error occurs while parsing the arguments, the interpreter will exit with value 2
+    args, extra = parser.parse_known_args()
+
+    # Show args to the user
+    print("    upstream: %s" % args.upstream)
+    print("      branch: %s" % args.branch)
+    print("        dest: %s" % args.dest)
+
+    mirror = SpackMirror(args.upstream, args.branch)
+    mirror.update()
+    mirror.checkout(args.dest, args.paths)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+
+import argparse
+import calendar
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from cache import cache_dir
+
+# A small SQLite store of what previous runs saw, per package: the last upstream
+# tag, when it was checked, the digest and the outcome, the last diff decision,
+# the inputs of successful builds, and the release history of repositories.
+# python scripts/state.py changed --hours 24
+
+schema = """
+CREATE TABLE IF NOT EXISTS checks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    package TEXT NOT NULL,
+    repo TEXT,
+    tag TEXT,
+    digest TEXT,
+    status TEXT,
+    error TEXT,
+    checked_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS checks_package ON checks (package, checked_at);
+CREATE INDEX IF NOT EXISTS checks_time ON checks (checked_at);
+CREATE TABLE IF NOT EXISTS diffs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    package TEXT NOT NULL,
+    decision TEXT,
+    checked_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS diffs_package ON diffs (package, checked_at);
+CREATE TABLE IF NOT EXISTS builds (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    package TEXT NOT NULL,
+    input_hash TEXT NOT NULL,
+    status TEXT,
+    built_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS builds_package ON builds (package, input_hash);
+CREATE TABLE IF NOT EXISTS releases (
+    repo TEXT NOT NULL,
+    tag TEXT NOT NULL,
+    published_at REAL,
+    seen_at REAL NOT NULL,
+    PRIMARY KEY (repo, tag)
+);
+"""
+
+# Outcomes of a check that looked upstream and wrote (or had nothing to write)
+completed_statuses = ["up-to-date", "updated"]
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description="Spack Updater State",
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    parser.add_argument("--db", help="path to state database")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    changed = subparsers.add_parser("changed", help="show packages that changed")
+    changed.add_argument(
+        "--hours", type=float, default=24, help="look back this many hours"
+    )
+    subparsers.add_parser("latest", help="show the latest check for each package")
+    return parser
+
+
+def as_dicts(cursor):
+    names = [x[0] for x in cursor.description]
+    return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+
+class StateStore:
+    """
+    Record and query release checks and diff decisions across runs.
+    """
+
+    def __init__(self, path=None):
+        self._path = path or os.environ.get("SPACK_UPDATER_STATE")
+        self.lock = threading.Lock()
+        self._ready = False
+
+    @property
+    def path(self):
+        if not self._path:
+            self._path = os.path.join(cache_dir("state"), "state.db")
+        return self._path
+
+    def connect(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        if not self._ready:
+            conn.executescript(schema)
+            self._ready = True
+        return conn
+
+    def execute(self, sql, params=()):
+        """
+        Run one statement in its own connection (so threads can share the store).
+        """
+        with self.lock:
+            conn = self.connect()
+            try:
+                with conn:
+                    cursor = conn.execute(sql, params)
+                    if cursor.description:
+                        return as_dicts(cursor)
+                    return []
+            finally:
+                conn.close()
+
+    def record_check(self, result, repo=None):
+        """
+        Record the result of a release check.
+        """
+        self.execute(
+            "INSERT INTO checks (package, repo, tag, digest, status, error, checked_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                result["package"],
+                repo,
+                result.get("version") or result.get("current"),
+                result.get("digest"),
+                result.get("status"),
+                result.get("error"),
+                time.time(),
+            ),
+        )
+
+    def record_diff(self, package, decision):
+        """
+        Record the decision of a diff against spack.
+        """
+        self.execute(
+            "INSERT INTO diffs (package, decision, checked_at) VALUES (?, ?, ?)",
+            (package, decision, time.time()),
+        )
+
+    def record_build(self, package, input_hash, status="success"):
+        """
+        Record the outcome of building a package with some inputs.
+        """
+        self.execute(
+            "INSERT INTO builds (package, input_hash, status, built_at) VALUES (?, ?, ?, ?)",
+            (package, input_hash, status, time.time()),
+        )
+
+    def was_built(self, package, input_hash):
+        """
+        Determine if a package was built successfully with these inputs.
+        """
+        rows = self.execute(
+            "SELECT id FROM builds WHERE package = ? AND input_hash = ? AND status = 'success' LIMIT 1",
+            (package, input_hash),
+        )
+        return bool(rows)
+
+    def record_release(self, repo, tag, published_at=None):
+        """
+        Record a release of a repository (once), with when it was published.
+        """
+        if published_at:
+            published_at = calendar.timegm(
+                time.strptime(published_at, "%Y-%m-%dT%H:%M:%SZ")
+            )
+        self.execute(
+            "INSERT OR IGNORE INTO releases (repo, tag, published_at, seen_at) "
+            "VALUES (?, ?, ?, ?)",
+            (repo, tag, published_at, time.time()),
+        )
+
+    def release_times(self, repo):
+        """
+        Get the times of the releases of a repository, oldest first.
+
+        Releases without a published time (e.g., tags) use when we first saw them.
+        """
+        rows = self.execute(
+            "SELECT COALESCE(published_at, seen_at) AS time FROM releases "
+            "WHERE repo = ? ORDER BY time",
+            (repo,),
+        )
+        return [row["time"] for row in rows]
+
+    def last_check(self, package, statuses=None):
+        """
+        Get the most recent release check for a package (optionally with a status).
+        """
+        sql = "SELECT * FROM checks WHERE package = ?"
+        params = [package]
+        if statuses:
+            sql += " AND status IN (%s)" % ", ".join("?" for _ in statuses)
+            params += list(statuses)
+        rows = self.execute(sql + " ORDER BY checked_at DESC LIMIT 1", params)
+        return rows[0] if rows else None
+
+    def recently_checked(self, package, hours):
+        """
+        Determine if a package was checked within some hours.
+
+        A dry run didn't write the update it found, and an error didn't
+        check, so only completed checks count.
+        """
+        check = self.last_check(package, completed_statuses)
+        if not check:
+            return False
+        return check["checked_at"] > time.time() - hours * 3600
+
+    def latest_checks(self):
+        """
+        Get the most recent release check for every package.
+        """
+        return self.execute(
+            "SELECT c.* FROM checks c JOIN "
+            "(SELECT package, MAX(checked_at) AS checked_at FROM checks GROUP BY package) l "
+            "ON c.package = l.package AND c.checked_at = l.checked_at ORDER BY c.package"
+        )
+
+    def changed_since(self, timestamp):
+        """
+        Get packages with a new version or a diff decision needing action since a time.
+        """
+        checks = self.execute(
+            "SELECT * FROM checks WHERE checked_at > ? AND status IN ('updated', 'dry-run') "
+            "ORDER BY checked_at",
+            (timestamp,),
+        )
+        diffs = self.execute(
+            "SELECT * FROM diffs WHERE checked_at > ? AND decision != 'unchanged' "
+            "ORDER BY checked_at",
+            (timestamp,),
+        )
+        return {"checks": checks, "diffs": diffs}
+
+
+def main():
+
+    parser = get_parser()
+
+    # If an error occurs while parsing the arguments, the interpreter will exit with value 2
+    args, extra = parser.parse_known_args()
+    store = StateStore(args.db)
+    if args.command == "changed":
+        result = store.changed_since(time.time() - args.hours * 3600)
+    else:
+        result = store.latest_checks()
+    print(json.dumps(result, indent=4))
+
+
+if __name__ == "__main__":
+    main()
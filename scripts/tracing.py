@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+
+import atexit
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+# Lightweight timing spans for the updater scripts. Each span is written as a
+# JSON line to SPACK_UPDATER_TRACE (if set), and when the script exits a Markdown
+# summary of phases and the slowest spans is appended to $GITHUB_STEP_SUMMARY.
+
+# Number of slowest spans to show in the summary
+slowest_count = 10
+
+
+class Span:
+    """
+    A named, timed unit of work with attributes (package, bytes, ...).
+    """
+
+    def __init__(self, name, **attrs):
+        self.name = name
+        self.attrs = attrs
+        self.start = time.time()
+        self.duration = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def to_dict(self):
+        data = {"name": self.name, "start": self.start, "duration": self.duration}
+        data.update(self.attrs)
+        return data
+
+
+class NullSpan(Span):
+    """
+    Returned when there is no current span, so set() is always safe.
+    """
+
+    def __init__(self):
+        super().__init__(None)
+
+    def set(self, **attrs):
+        pass
+
+
+class Tracer:
+    def __init__(self):
+        self.spans = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.registered = False
+
+    @property
+    def stack(self):
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    def current(self):
+        return self.stack[-1] if self.stack else NullSpan()
+
+    @contextlib.contextmanager
+    def span(self, name, **attrs):
+        """
+        Time a block of work as a span.
+        """
+        span = Span(name, **attrs)
+        self.stack.append(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.set(error=str(e) or type(e).__name__)
+            raise
+        finally:
+            self.stack.pop()
+            span.duration = round(time.time() - span.start, 6)
+            self.record(span)
+
+    def record(self, span):
+        with self.lock:
+            if not self.registered:
+                atexit.register(self.write_summary)
+                self.registered = True
+            self.spans.append(span)
+            trace_file = os.environ.get("SPACK_UPDATER_TRACE")
+            if trace_file:
+                with open(trace_file, "a") as fd:
+                    fd.write(json.dumps(span.to_dict()) + "\n")
+
+    def summary(self):
+        """
+        Summarize phases (count, total, max, bytes) and the slowest spans as Markdown.
+        """
+        phases = {}
+        for span in self.spans:
+            phase = phases.setdefault(
+                span.name, {"count": 0, "total": 0, "max": 0, "bytes": 0}
+            )
+            phase["count"] += 1
+            phase["total"] += span.duration
+            phase["max"] = max(phase["max"], span.duration)
+            phase["bytes"] += span.attrs.get("bytes") or 0
+
+        lines = [
+            "### Spack Updater Timing",
+            "",
+            "| Phase | Count | Total (s) | Max (s) | Bytes |",
+            "|-------|-------|-----------|---------|-------|",
+        ]
+        for name, phase in sorted(phases.items(), key=lambda x: -x[1]["total"]):
+            lines.append(
+                "| %s | %s | %.2f | %.2f | %s |"
+                % (name, phase["count"], phase["total"], phase["max"], phase["bytes"])
+            )
+
+        lines += [
+            "",
+            "| Slowest | Package | Duration (s) | Bytes |",
+            "|---------|---------|--------------|-------|",
+        ]
+        slowest = sorted(self.spans, key=lambda x: -x.duration)[:slowest_count]
+        for span in slowest:
+            lines.append(
+                "| %s | %s | %.2f | %s |"
+                % (
+                    span.name,
+                    span.attrs.get("package") or "",
+                    span.duration,
+                    span.attrs.get("bytes") or "",
+                )
+            )
+        return "\n".join(lines) + "\n\n"
+
+    def write_summary(self):
+        summary_file = os.environ.get("GITHUB_STEP_SUMMARY")
+        if not summary_file or not self.spans:
+            return
+        with open(summary_file, "a") as fd:
+            fd.write(self.summary())
+
+
+# A default tracer shared by the module-level helpers
+tracer = Tracer()
+
+
+def span(name, **attrs):
+    return tracer.span(name, **attrs)
+
+
+def current():
+    return tracer.current()
+
+
+def traced(name, package_arg=None):
+    """
+    Decorate a method to run as a span.
+
+    The package is taken from self.package, or the basename of the positional
+    argument at package_arg (e.g., a package name or directory).
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            package = getattr(self, "package", None)
+            if package_arg is not None and len(args) > package_arg:
+                package = os.path.basename(str(args[package_arg]).rstrip(os.sep))
+            with tracer.span(name, package=package):
+                return func(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -2,18 +2,22 @@
 
 import argparse
 import copy
+import errno
+import fcntl
 import json
 import os
 import re
 import shutil
 import subprocess
 import sys
-import tempfile
-import urllib.parse
 
-import requests
 import yaml
 
+import state
+import tracing
+from issues import IssueReconciler
+from spack_mirror import SpackMirror
+
 here = os.path.dirname(os.path.abspath(__file__))
 
 # GITHUB_TOKEN required no matter what
@@ -21,6 +25,9 @@ token = os.environ.get("GITHUB_TOKEN")
 if not token:
     sys.exit("GITHUB_TOKEN is required")
 
+# ioctl to clone a file (reflink) on filesystems that support it (btrfs, xfs)
+FICLONE = 0x40049409
+
 headers = {"Accept": "application/vnd.github+json", "Authorization": "token %s" % token}
 
 # intended to be run in GitHub actions
@@ -38,13 +45,38 @@ def get_parser():
         formatter_class=argparse.RawTextHelpFormatter,
     )
     parser.add_argument(
-        "package", help="name of package under packages (in local directory) to parse"
+        "packages",
+        nargs="*",
+        help="names of packages under packages (in local directory) to parse",
+    )
+    parser.add_argument(
+        "--all",
+        dest="all_packages",
+        action="store_true",
+        default=False,
+        help="diff all packages under packages (in local directory)",
     )
     parser.add_argument(
         "--repo",
         help="repository directory",
         default=os.getcwd(),
     )
+    parser.add_argument(
+        "--verbose",
+        action="store_true",
+        default=False,
+        help="show the last commit of each compared file",
+    )
+    parser.add_argument(
+        "--output",
+        help="write the JSON decision table for multiple packages to this file",
+    )
+    parser.add_argument(
+        "--issues",
+        action="store_true",
+        default=False,
+        help="open (or update and close) request issues for the diffed packages",
+    )
     parser.add_argument(
         "--upstream",
         help="repository upstream to update",
@@ -76,71 +108,29 @@ class SpackChangeRequest:
             data["branch"] = self.from_branch
         return data
 
-    def has_issues(self, title):
-        """
-        Given a new issue to be opened, return True if an issue is already open.
-        """
-        url = "https://api.github.com/repos/%s/issues" % self.from_repo
-        response = requests.get(url, headers=headers)
-        if response.status_code != 200:
-            sys.exit("Issue retrieving previous issues.")
-        issues = response.json()
-        issues = [x for x in issues if "pull_request" not in x]
-        for issue in issues:
-            if issue["title"].strip() == title.strip():
-                return True
-        return False
-
-    def delete_issue(self, number):
-        """
-        Delete an old issue for a previous update request.
-
-        This isn't currently used. The original updater logic always opened a new issue
-        (and closed previous ones) but given the slowness of the PR review process,
-        this will make a huge number of issues. Instead, if we find an open issue
-        we simply don't open a new one.
-        """
-        print("Found old issue to close %s" % number)
-        url = "https://api.github.com/repos/%s/issues/%s" % (self.from_repo, number)
-        data = {"number": number, "state": "closed"}
-        response = requests.patch(url, headers=headers, data=json.dumps(data))
-        if response.status_code != 200:
-            sys.exit("Issue closing issue %s" % number)
+    @property
+    def title(self):
+        return "[package-update] request to update %s" % self.package
 
-    def submit(self):
-        """
-        Submit an update or new package request by opening an issue on our own repo
-        """
-        title = "[package-update] request to update %s" % self.package
-        body = (
+    @property
+    def body(self):
+        return (
             "This is a request for an automated package update. Add the spack-updater label to this issue to trigger it.\n\n"
             + yaml.dump(self.data)
         )
-        print(f"Title: {title}")
-        print(body)
-        if self.has_issues(title):
-            print(f"Request {title} already has an issue opened, not re-opening.")
-            return
-
-        # This is the url we assemble that will be provided in the issue to trigger an update workflow
-        encoded_title = urllib.parse.quote(title)
-        encoded_body = urllib.parse.quote(body)
-
-        # prepare the message
-        if not self.from_repo:
-            return
 
-        url = "https://api.github.com/repos/%s/issues" % self.from_repo
-        issue = {"title": title, "body": body}
-        response = requests.post(url, headers=headers, data=json.dumps(issue))
-        if response.status_code not in [200, 201]:
-            sys.exit(
-                "Issue making request: %s, %s" % (response.reason, response.json())
-            )
+    def submit(self, reconciler=None):
+        """
+        Submit an update or new package request by opening an issue on our own repo
 
-        # Show url to user
-        res = response.json()
-        print("Opened request issue:\n%s" % res["html_url"])
+        An issue that is already open is updated (if the request changed) rather
+        than opened again. To submit many requests, reconcile them together with
+        PackageDiffer.reconcile_issues, which lists open issues only once.
+        """
+        print(f"Title: {self.title}")
+        print(self.body)
+        reconciler = reconciler or IssueReconciler(self.from_repo, headers)
+        return reconciler.reconcile({self.title: {"body": self.body}})
 
     def populate_new_package(self, package_path):
         """
@@ -160,9 +150,19 @@ class PackageDiffer:
     Determine if a package is different and act accordingly.
     """
 
-    def __init__(self, repo, upstream, branch="develop"):
+    # Possible outcomes of a diff
+    decisions = ["from_spack", "to_spack", "new", "unchanged"]
+
+    def __init__(self, repo, upstream, branch="develop", packages=None, verbose=False):
         self.repo = os.path.abspath(repo)
-        self.spack_root = self.clone(upstream, branch)
+        self.packages = packages or []
+        self.verbose = verbose
+        self.spack_root = self.clone(upstream, branch, packages)
+        self.requests = {}
+        self.changesets = {}
+        self._spack_index = None
+        self._local_index = None
+        self._local_toplevel = None
 
     def find_package(self, package_name):
         """
@@ -190,46 +190,65 @@ class PackageDiffer:
             with open(env_file, "a") as fd:
                 fd.write(f"{key}=true\n")
 
+    def set_changeset(self, changeset):
+        """
+        Tell the running action how many files were staged from spack.
+        """
+        env_file = os.getenv("GITHUB_ENV")
+        if env_file:
+            count = sum(len(x) for x in changeset.values())
+            with open(env_file, "a") as fd:
+                fd.write(f"spack_updater_changes={count}\n")
+
     def spack_package_dir(self, package_name):
         """
         Get full path to current spack package directory.
         """
-        return os.path.join(
-            self.spack_root,
-            "var",
-            "spack",
-            "repos",
-            "builtin",
-            "packages",
-            package_name,
-        )
+        return os.path.join(self.spack_root, spack_package_path(package_name))
 
     def cleanup(self):
         if self.spack_root and os.path.exists(self.spack_root):
-            shutil.rmtree(self.spack_root)
+            self.mirror.remove(self.spack_root)
 
     def git_modified_time(self, path, root):
         """
         Get last modified date or time.
         """
         # This is the full git commit, for debugging
-        cmd = ["git", "log", "-1", path]
-        p = subprocess.Popen(cmd, cwd=root, stdout=subprocess.PIPE)
-        out, _ = p.communicate()
-        print(out.decode("utf-8").strip())
+        if self.verbose:
+            cmd = ["git", "log", "-1", path]
+            p = subprocess.Popen(cmd, cwd=root, stdout=subprocess.PIPE)
+            out, _ = p.communicate()
+            print(out.decode("utf-8").strip())
 
-        # This gives the unix timestamp
-        cmd = ["git", "log", "-1", "--pretty=%ct", path]
-        p = subprocess.Popen(cmd, cwd=root, stdout=subprocess.PIPE)
-        out, _ = p.communicate()
-        return int(out.decode("utf-8").strip())
+        # This gives the unix timestamp, from one index per repository
+        return self.git_index(root).modified_time(path)
 
+    def git_index(self, root):
+        """
+        Get (and build once) the timestamp index for the spack or local repository.
+        """
+        root = os.path.realpath(root)
+        if root.startswith(os.path.realpath(self.spack_root)):
+            if not self._spack_index:
+                paths = [spack_package_path(package) for package in self.packages]
+                self._spack_index = GitTimestampIndex(
+                    self.spack_root, paths or [spack_package_path("")]
+                )
+            return self._spack_index
+        if not self._local_index:
+            self._local_index = GitTimestampIndex(self.repo, ["packages"])
+        return self._local_index
+
+    @tracing.traced("diff", package_arg=0)
     def diff(self, package_name):
         """
         Perform a diff:
 
         1. look for changed files and compare based on change date.
         2. look for added or removed files.
+
+        Returns the decision: from_spack, to_spack, new, or unchanged.
         """
         package_dir = self.find_package(package_name)
         spack_package_dir = self.spack_package_dir(package_name)
@@ -241,26 +260,41 @@ class PackageDiffer:
         if not os.path.exists(spack_package_dir):
 
             request.populate_new_package(os.path.relpath(package_dir, self.repo))
-            return request
-
-        # For each file in current, compare to spack install
+            self.requests[package_name] = request
+            return "new"
+
+        # Compare git trees first, most of the time nothing has changed
+        basenames = self.changed_files(package_name, package_dir)
+        if basenames is not None and not basenames:
+            print(f"Package {package_name} is the same as in spack.")
+            return "unchanged"
+
+        # Without trees to compare, look at every file in current
+        if basenames is None:
+            basenames = []
+            for filename in recursive_find(package_dir):
+                basename = filename.replace(package_dir, "").strip(os.sep)
+
+                # Ignore version file
+                if basename.endswith("VERSION"):
+                    continue
+
+                # Could be that it's a new file, OR...
+                # There could be the case here of a file being deleted...
+                if not os.path.exists(os.path.join(spack_package_dir, basename)):
+                    continue
+                basenames.append(basename)
+
+        # For each changed file, compare to spack install
         # Keep track of last modified for each
         last_modified_here = 0
         last_modified_spack = 0
-        for filename in recursive_find(package_dir):
-            basename = filename.replace(package_dir, "").strip(os.sep)
+        for basename in basenames:
+            filename = os.path.join(package_dir, basename)
             spack_filename = os.path.join(spack_package_dir, basename)
 
-            # Ignore version file
-            if basename.endswith("VERSION"):
-                continue
-
-            # Could be that it's a new file, OR...
-            # There could be the case here of a file being deleted...
-            if not os.path.exists(spack_filename):
-                continue
-
-            # The spack file was modified more recently (later time)
+            # A file missing on one side has the time it was deleted there (or
+            # 0 if it never existed), so a newer deletion wins over an old edit
             modified_spack = self.git_modified_time(
                 spack_filename, root=spack_package_dir
             )
@@ -286,50 +320,276 @@ class PackageDiffer:
         # Final decision based on most recently modified
         # Spack changes are newer
         if last_modified_spack > last_modified_here:
-            self.stage_changes(spack_package_dir, package_dir)
-            self.set_changes("spack_updater_from_spack")
+            changeset = self.stage_changes(spack_package_dir, package_dir)
+            self.changesets[package_name] = changeset
+            return "from_spack"
 
         # Local changes are newer
         elif last_modified_here > last_modified_spack:
-            self.set_changes("spack_updater_to_spack")
+            request.populate_update_package(os.path.relpath(package_dir, self.repo))
+            self.requests[package_name] = request
+            return "to_spack"
+        return "unchanged"
+
+    def diff_all(self, package_names, store=None):
+        """
+        Diff many packages against the same spack checkout.
+
+        Returns a decision table, with packages listed under each decision,
+        and the last release seen by the release checker (from the state store).
+        """
+        table = {"packages": {}, "releases": {}, "changesets": self.changesets}
+        for decision in self.decisions + ["error"]:
+            table[decision] = []
+        for package_name in package_names:
+            try:
+                decision = self.diff(package_name)
+            except (SystemExit, Exception) as e:
+                print(f"Error diffing {package_name}: {e}")
+                decision = "error"
+            table["packages"][package_name] = decision
+            table[decision].append(package_name)
+            if store:
+                store.record_diff(package_name, decision)
+                check = store.last_check(package_name)
+                table["releases"][package_name] = check["tag"] if check else None
+        return table
+
+    def reconcile_issues(self, package_names, reconciler=None):
+        """
+        Open, update or close request issues for diffed packages in one pass.
+
+        Packages with a change request get an issue, and the request issues of
+        other packages (now unchanged, or changed in spack) are closed.
+        """
+        desired = {}
+        for package_name in package_names:
+            request = self.requests.get(package_name) or SpackChangeRequest(
+                package_name, self.upstream, self.branch
+            )
+            desired[request.title] = (
+                {"body": request.body} if package_name in self.requests else None
+            )
+        reconciler = reconciler or IssueReconciler(from_repository, headers)
+        return reconciler.reconcile(desired)
 
+    def changed_files(self, package_name, package_dir):
+        """
+        Compare git trees of the package here and in spack.
+
+        Identical tree ids return an empty list right away. Otherwise we compare
+        blob ids per file to find files that are modified, added, or removed.
+        None is returned if either package directory isn't committed.
+        """
+        if not self._local_toplevel:
+            self._local_toplevel = git_toplevel(self.repo)
+        relpath = os.path.relpath(os.path.realpath(package_dir), self._local_toplevel)
+        tree_here = git_tree_id(self._local_toplevel, relpath)
+        tree_spack = git_tree_id(self.spack_root, spack_package_path(package_name))
+        if not tree_here or not tree_spack:
+            return
+        if tree_here == tree_spack:
+            return []
+
+        blobs_here = git_blobs(self._local_toplevel, tree_here)
+        blobs_spack = git_blobs(self.spack_root, tree_spack)
+        changed = []
+        for basename in sorted(set(blobs_here) | set(blobs_spack)):
+            if basename.endswith("VERSION"):
+                continue
+            if blobs_here.get(basename) != blobs_spack.get(basename):
+                changed.append(basename)
+        print(f"Changed files for {package_name}: {' '.join(changed) or 'none'}")
+        return changed
+
+    @tracing.traced("stage_changes", package_arg=1)
     def stage_changes(self, src, dst):
         """
-        Stage changes here
+        Sync the spack package directory here, touching only what changed.
+
+        Files with different content are replaced (with a reflink or hardlink
+        when the filesystem allows), files no longer in spack are removed, and
+        the changeset (added, modified, removed) is returned. The VERSION file
+        is ours and kept.
         """
+        changeset = {"added": [], "modified": [], "removed": []}
+        synced = set()
         for filename in recursive_find(src):
-            basename = filename.replace(src, "").strip(os.sep)
+            basename = os.path.relpath(filename, src)
+            synced.add(basename)
             to_filename = os.path.join(dst, basename)
-            if os.path.exists(to_filename):
-                os.remove(to_filename)
-            dest_dir = os.path.dirname(to_filename)
-            if not os.path.exists(dest_dir):
-                os.makedirs(dest_dir)
-            shutil.copyfile(filename, to_filename)
-
-    def clone(self, upstream, branch=None):
-        """
-        Clone spack develop to a temporary directory.
-        """
-        # The user can provide just the org/reponame
-        if not upstream.startswith("http"):
-            upstream = f"https://github.com/{upstream}"
-        tmpdir = tempfile.mkdtemp()
-        cmd = ["git", "clone", "--depth", "1"]
-        if branch:
-            cmd += ["--branch", branch]
-        cmd += [upstream, tmpdir]
+            if not os.path.exists(to_filename):
+                changeset["added"].append(basename)
+            elif same_content(filename, to_filename):
+                continue
+            else:
+                changeset["modified"].append(basename)
+            os.makedirs(os.path.dirname(to_filename), exist_ok=True)
+            link_or_copy(filename, to_filename)
+
+        for filename in recursive_find(dst):
+            basename = os.path.relpath(filename, dst)
+            if basename in synced or basename == "VERSION":
+                continue
+            os.remove(filename)
+            changeset["removed"].append(basename)
+
+        # Clean up directories left empty by removed files
+        for root, dirs, files in os.walk(dst, topdown=False):
+            if root != dst and not os.listdir(root):
+                os.rmdir(root)
+
+        for key in changeset:
+            changeset[key].sort()
+            for basename in changeset[key]:
+                print(f"{key.capitalize()}: {basename}")
+        return changeset
+
+    @tracing.traced("clone")
+    def clone(self, upstream, branch=None, packages=None):
+        """
+        Check out spack develop from a persistent mirror to a temporary directory.
+
+        The mirror is updated with an incremental fetch, and if we know the
+        packages we care about, only those package directories are checked out.
+        """
+        self.mirror = SpackMirror(upstream, branch or "develop")
         try:
-            subprocess.run(cmd, check=True)
-        except subprocess.CalledProcessError as e:
+            self.mirror.update()
+            paths = None
+            if packages:
+                paths = [spack_package_path(package) for package in packages]
+            tmpdir = self.mirror.checkout(paths=paths)
+        except ValueError as e:
             raise ValueError("Failed to clone spack develop repository:\n{}", e)
 
         # Save for knowing later
-        self.upstream = upstream
+        self.upstream = self.mirror.upstream
         self.branch = branch
         return tmpdir
 
 
+class GitTimestampIndex:
+    """
+    Map every file under some paths of a repository to its last commit time.
+
+    This is one git log walk per repository instead of one per file.
+    """
+
+    def __init__(self, root, paths):
+        self.root = git_toplevel(root)
+        self.times = {}
+        self.build(root, paths)
+
+    def build(self, root, paths):
+        """
+        Walk the log newest first, the first time we see a path is its last change.
+        """
+        cmd = ["git", "-c", "core.quotepath=off", "log", "--name-only"]
+        cmd += ["--format=%x00%ct", "--"] + paths
+        with tracing.span("git_log"):
+            out = subprocess.run(cmd, cwd=root, stdout=subprocess.PIPE, check=True)
+        timestamp = None
+        for line in out.stdout.decode("utf-8").split("\n"):
+            if line.startswith("\0"):
+                timestamp = int(line[1:])
+            elif line and line not in self.times:
+                self.times[line] = timestamp
+
+    def modified_time(self, path):
+        """
+        Get the last commit time of a path (0 if it was never committed).
+
+        The log lists deleted paths too, so a path that is gone has the time
+        of the commit that deleted it.
+        """
+        relpath = os.path.relpath(os.path.realpath(path), self.root)
+        return self.times.get(relpath, 0)
+
+
+def git_toplevel(root):
+    """
+    Get the top level directory of the git repository with root.
+    """
+    cmd = ["git", "rev-parse", "--show-toplevel"]
+    out = subprocess.run(cmd, cwd=root, stdout=subprocess.PIPE, check=True)
+    return os.path.realpath(out.stdout.decode("utf-8").strip())
+
+
+def git_tree_id(root, path):
+    """
+    Get the tree id of a directory at HEAD, or None if it isn't committed.
+    """
+    cmd = ["git", "rev-parse", "--verify", "--quiet", f"HEAD:{path}"]
+    out = subprocess.run(cmd, cwd=root, stdout=subprocess.PIPE)
+    if out.returncode != 0:
+        return
+    return out.stdout.decode("utf-8").strip()
+
+
+def git_blobs(root, tree_id):
+    """
+    Get a lookup of path (relative to the tree) to blob id for a tree.
+    """
+    cmd = ["git", "ls-tree", "-r", "-z", tree_id]
+    out = subprocess.run(cmd, cwd=root, stdout=subprocess.PIPE, check=True)
+    blobs = {}
+    for entry in out.stdout.decode("utf-8").split("\0"):
+        if not entry:
+            continue
+        meta, path = entry.split("\t", 1)
+        blobs[path] = meta.split()[2]
+    return blobs
+
+
+def spack_package_path(package_name):
+    """
+    Get the path of a package directory relative to the spack root.
+    """
+    return os.path.join("var", "spack", "repos", "builtin", "packages", package_name)
+
+
+def same_content(filename, other):
+    """
+    Determine if two files have the same content (or are the same file).
+    """
+    if os.path.samefile(filename, other):
+        return True
+    if os.path.getsize(filename) != os.path.getsize(other):
+        return False
+    with open(filename, "rb") as fd, open(other, "rb") as ofd:
+        while True:
+            chunk = fd.read(65536)
+            if chunk != ofd.read(65536):
+                return False
+            if not chunk:
+                return True
+
+
+def link_or_copy(src, dst):
+    """
+    Replace dst with the content of src, sharing blocks if we can.
+
+    A reflink (copy on write) is tried first, then a hardlink, and then a
+    plain copy. The new file is moved into place so dst is never partial.
+    """
+    tmpfile = os.path.join(os.path.dirname(dst), ".%s.tmp" % os.path.basename(dst))
+    if os.path.lexists(tmpfile):
+        os.remove(tmpfile)
+    try:
+        with open(src, "rb") as fsrc, open(tmpfile, "wb") as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    except OSError:
+        os.remove(tmpfile)
+        try:
+            os.link(src, tmpfile)
+        except OSError as e:
+            if e.errno not in [errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP]:
+                raise
+            shutil.copyfile(src, tmpfile)
+    os.replace(tmpfile, dst)
+
+
 def recursive_find(base, pattern=None):
     """
     Find filenames that match a particular pattern, and yield them.
@@ -345,21 +605,79 @@ def recursive_find(base, pattern=None):
             yield fullpath
 
 
+def find_packages(repo):
+    """
+    Find the names of all packages (with a package.py) under packages.
+    """
+    packages_dir = os.path.join(repo, "packages")
+    if not os.path.exists(packages_dir):
+        sys.exit(f"{packages_dir} does not exist.")
+    return [
+        name
+        for name in sorted(os.listdir(packages_dir))
+        if os.path.exists(os.path.join(packages_dir, name, "package.py"))
+    ]
+
+
 def main():
 
     parser = get_parser()
 
     # If an error occurs while parsing the arguments, the interpreter will exit with value 2
     args, extra = parser.parse_known_args()
+    packages = args.packages
+    if args.all_packages:
+        packages = find_packages(args.repo)
+
+    # The same package given twice is only diffed once
+    packages = list(dict.fromkeys(packages))
+    if not packages:
+        sys.exit("Please provide one or more packages, or --all.")
 
     # Show args to the user
     print("    upstream: %s" % args.upstream)
-    print("     package: %s" % args.package)
+    print("    packages: %s" % " ".join(packages))
     print("        repo: %s" % args.repo)
 
-    cli = PackageDiffer(args.repo, args.upstream)
-    cli.diff(args.package)
+    cli = PackageDiffer(
+        args.repo, args.upstream, packages=packages, verbose=args.verbose
+    )
+
+    # Decisions are recorded with release checks for the next run
+    store = state.StateStore()
+
+    # A single package sets the environment for the next steps
+    if len(packages) == 1 and not args.all_packages:
+        decision = cli.diff(packages[0])
+        store.record_diff(packages[0], decision)
+        if decision in ["from_spack", "to_spack"]:
+            cli.set_changes(f"spack_updater_{decision}")
+        if packages[0] in cli.changesets:
+            cli.set_changeset(cli.changesets[packages[0]])
+        if args.issues:
+            cli.reconcile_issues(packages)
+        cli.cleanup()
+        return
+
+    # Otherwise all packages are diffed with one clone for a decision table
+    table = cli.diff_all(packages, store)
     cli.cleanup()
+    if args.issues:
+        diffed = [x for x in packages if table["packages"][x] != "error"]
+        table["issues"] = [
+            {k: v for k, v in x.items() if k in ["op", "title", "url", "error"]}
+            for x in cli.reconcile_issues(diffed)
+        ]
+    for package_name, decision in table["packages"].items():
+        print("%-30s %s" % (package_name, decision))
+
+    if args.output:
+        with open(args.output, "w") as fd:
+            fd.write(json.dumps(table, indent=4))
+    output_file = os.environ.get("GITHUB_OUTPUT")
+    if output_file:
+        with open(output_file, "a") as fd:
+            fd.write("decisions=%s\n" % json.dumps(table))
 
 
 if __name__ == "__main__":
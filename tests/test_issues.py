@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+
+import importlib
+import json
+import os
+import sys
+
+import pytest
+
+# Plans of the issue reconciler, which can close issues in a repository
+# python -m pytest tests/
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(here), "scripts"))
+import issues  # noqa: E402
+
+
+def issue(number, title, body="body", labels=None):
+    return {
+        "number": number,
+        "title": title,
+        "body": body,
+        "labels": [{"name": x} for x in labels or []],
+    }
+
+
+@pytest.fixture
+def reconciler(monkeypatch):
+    open_issues = [
+        issue(3, "[package-update] request to update b"),
+        issue(1, "[package-update] request to update a", labels=["bug"]),
+        issue(2, "[package-update] request to update b "),
+        issue(4, "[package-update] request to update c"),
+        issue(5, "unrelated", body=None),
+    ]
+    monkeypatch.setattr(issues, "list_issues", lambda repo, headers: open_issues)
+    return issues.IssueReconciler("owner/repo", {})
+
+
+def ops(operations):
+    return [(x["op"], x["issue"]["number"] if x["issue"] else None) for x in operations]
+
+
+def test_unchanged_body(reconciler):
+    assert (
+        reconciler.plan({"[package-update] request to update a": {"body": "body"}})
+        == []
+    )
+
+    # Whitespace around the body (and title) doesn't count as a change
+    desired = {" [package-update] request to update a": {"body": "body\n"}}
+    assert reconciler.plan(desired) == []
+
+
+def test_changed_body(reconciler):
+    operations = reconciler.plan(
+        {"[package-update] request to update a": {"body": "new"}}
+    )
+    assert ops(operations) == [("update", 1)]
+    assert operations[0]["data"] == {"body": "new"}
+
+
+def test_create(reconciler):
+    spec = {"body": "d", "labels": ["spack-updater"]}
+    operations = reconciler.plan({"[package-update] request to update d": spec})
+    assert ops(operations) == [("create", None)]
+    assert operations[0]["data"] == {
+        "title": "[package-update] request to update d",
+        "body": "d",
+        "labels": ["spack-updater"],
+    }
+
+
+def test_duplicates_keep_oldest(reconciler):
+    operations = reconciler.plan(
+        {"[package-update] request to update b": {"body": "body"}}
+    )
+    assert ops(operations) == [("close", 3)]
+    assert operations[0]["reason"] == "duplicate"
+    assert operations[0]["data"] == {"state": "closed"}
+
+
+def test_none_closes_every_match(reconciler):
+    operations = reconciler.plan(
+        {
+            "[package-update] request to update b": None,
+            "[package-update] request to update c": None,
+            "[package-update] request to update e": None,
+        }
+    )
+    assert ops(operations) == [("close", 2), ("close", 3), ("close", 4)]
+    assert all(x["reason"] == "not needed" for x in operations)
+
+
+def test_labels_are_merged(reconciler):
+    spec = {"body": "body", "labels": ["bug", "spack-updater"]}
+    operations = reconciler.plan({"[package-update] request to update a": spec})
+    assert ops(operations) == [("update", 1)]
+    assert operations[0]["data"] == {"labels": ["bug", "spack-updater"]}
+
+    # Labels that are already there (and extra ones) are left alone
+    spec = {"body": "body", "labels": ["bug"]}
+    assert reconciler.plan({"[package-update] request to update a": spec}) == []
+
+
+def test_only_desired_titles(reconciler):
+    # Issues that aren't mentioned are never touched
+    assert reconciler.plan({}) == []
+    operations = reconciler.plan({"[package-update] request to update c": None})
+    assert ops(operations) == [("close", 4)]
+
+
+def test_dry_run_sends_nothing(reconciler, monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("a dry run should not send requests")
+
+    monkeypatch.setattr(issues.client, "post", fail)
+    monkeypatch.setattr(issues.client, "patch", fail)
+    reconciler.dry_run = True
+    operations = reconciler.reconcile(
+        {
+            "[package-update] request to update c": None,
+            "[package-update] request to update d": {"body": "d"},
+        }
+    )
+    assert ops(operations) == [("close", 4), ("create", None)]
+
+
+class Response:
+    def __init__(self, status_code, data):
+        self.status_code = status_code
+        self.data = data
+        self.text = json.dumps(data)
+
+    def json(self):
+        return self.data
+
+
+def test_new_issue_is_linked_once(monkeypatch):
+    monkeypatch.setenv("GITHUB_TOKEN", "token")
+    monkeypatch.setenv("GITHUB_REPOSITORY", "owner/repo")
+    monkeypatch.setenv("BRANCH_FROM", "update-a")
+    monkeypatch.setenv("package", "a")
+    open_issue = importlib.reload(importlib.import_module("open_issue"))
+    monkeypatch.setattr(issues, "list_issues", lambda repo, headers: [])
+
+    sent = []
+
+    def post(url, headers=None, data=None):
+        sent.append(("post", url, json.loads(data)))
+        return Response(201, {"number": 7, "html_url": "https://github.com/7"})
+
+    def patch(url, headers=None, data=None):
+        sent.append(("patch", url, json.loads(data)))
+        return Response(200, {"number": 7, "html_url": "https://github.com/7"})
+
+    monkeypatch.setattr(issues.client, "post", post)
+    monkeypatch.setattr(issues.client, "patch", patch)
+    open_issue.open_issue()
+
+    # One request opens the issue, and one adds the link that closes it
+    assert [x[0] for x in sent] == ["post", "patch"]
+    assert sent[1][1].endswith("/repos/owner/repo/issues/7")
+    assert "issues/7" in sent[1][2]["body"]
+    assert "pull/new/update-a" in sent[1][2]["body"]
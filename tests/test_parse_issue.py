@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+import os
+import subprocess
+import sys
+
+# Parsing the request in a [package-update] issue body
+# python -m pytest tests/
+
+here = os.path.dirname(os.path.abspath(__file__))
+scripts = os.path.join(os.path.dirname(here), "parse-issue", "scripts")
+sys.path.insert(0, scripts)
+import parse_issue  # noqa: E402
+
+
+def test_values_are_kept_as_written():
+    body = (
+        "This is a request for an automated package update.\n\n"
+        "action: update-package\n"
+        "branch: 1.10\n"
+        "package: flux-core\n"
+        "path: packages/flux-core\n"
+        "repo: flux-framework/spack\n"
+        "run_tests: yes\n"
+        "version: 0.50\n"
+    )
+    values = parse_issue.parse_issue_text(body)
+    assert values == {
+        "action": "update-package",
+        "branch": "1.10",
+        "package": "flux-core",
+        "path": "packages/flux-core",
+        "repo": "flux-framework/spack",
+        "run_tests": "yes",
+        "version": "0.50",
+    }
+
+
+def test_quoted_and_empty_values():
+    body = "Update\r\n\r\naction: new-package\r\nbranch: '1.10'\r\nrepo:\r\n"
+    values = parse_issue.parse_issue_text(body)
+    assert values == {"action": "new-package", "branch": "1.10", "repo": ""}
+
+
+def test_fallback_to_key_value_lines():
+    body = "action: update-package\npath: packages/a\n- not: [yaml"
+    values = parse_issue.parse_issue_text(body)
+    assert values["action"] == "update-package"
+    assert values["path"] == "packages/a"
+
+
+def test_single_issue_does_not_need_the_client():
+    # Only --batch talks to GitHub, parsing one issue is yaml alone
+    code = "import sys, parse_issue; assert 'requests' not in sys.modules"
+    subprocess.run([sys.executable, "-c", code], cwd=scripts, check=True)